@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of packet encoding in T5UIC1_LCD.
+
+Encodes a frame shaped like the main menu (clear, four icon buttons, the power
+button, the network bar, and a few numbers) against a headless port, and
+compares it with the original encoder, which built format strings, a fresh
+bytearray, and ran a regex for every packet, and wrote and flushed each
+packet on its own.
+
+Then does the same the way the renderer now draws: it records the frame into
+a display list and replays it with send_raw, with and without CRCs. The
+original had no recording and no CRCs, so that is still compared with it
+sending directly.
+
+Run on the printer's Pi with ``just py benchmarks/encode.py``.
+"""
+import re
+import struct
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pintail.systems.dwin_screen import T5UIC1_LCD, Commands, _p  # noqa: E402
+from pintail.systems.dwin_model import ModelPort  # noqa: E402
+from pintail.systems.display_list import DisplayList  # noqa: E402
+
+
+class NullPort(ModelPort):
+    """
+    Answers the handshake, then discards everything
+    """
+    def write(self, data):
+        if self.bytes_written:
+            self.bytes_written += len(data)
+            return len(data)
+        return super().write(data)
+
+
+class LegacyEncoder:
+    """
+    The encoder as it was before packets were packed in place.
+    """
+    PACKET_HEAD = T5UIC1_LCD.PACKET_HEAD
+    PACKET_TAIL = T5UIC1_LCD.PACKET_TAIL
+    Font = T5UIC1_LCD.Font
+
+    def __init__(self, port):
+        self.port = port
+
+    def _send(self, cmd, fmt, *fields, flush=True):
+        buff = bytearray(self.PACKET_HEAD)
+        try:
+            buff += struct.pack('>B' + fmt, cmd, *fields)
+        except struct.error:
+            print(f"{'>B' + fmt} {[cmd, *fields]!r}")
+            raise
+        buff += self.PACKET_TAIL
+        self.port.write(buff)
+        if flush:
+            self.port.flush()
+
+    def begin_frame(self):
+        pass
+
+    def commit(self):
+        self._send(0x3D, '')
+
+    def clear_screen(self, color):
+        self._send(Commands.CLEAR_SCREEN, 'H', color)
+
+    def draw_rect(self, mode, color, start, end):
+        self._send(Commands.DRAW_RECT, 'BH2H2H', mode, color, *_p(start), *_p(end))
+
+    def draw_icon(self, pos, lib_id, icon_id):
+        self._send(Commands.DRAW_ICON, '2HBB', *_p(pos), 0x80 | lib_id, icon_id)
+
+    def draw_text(self, pos, font, text, *, fg_color, bg_color, monospace):
+        btext = text.encode('utf-8')
+        self._send(
+            Commands.DRAW_TEXT, f'BHH2H{len(btext)}s',
+            (monospace << 7) | ((bg_color is not None) << 6) | (font & 0b1111),
+            fg_color, bg_color or 0, *_p(pos), btext,
+        )
+
+    __number_format = re.compile(r"^(?P<prefix>[+])?(?P<fill>[ 0])?(?P<digits>\d+)(?:\.(?P<precision>\d+))?$")
+
+    def draw_number(self, pos, font, fmt, value, *, fg_color, bg_color):
+        fmtmatch = self.__number_format.match(fmt)
+        assert fmtmatch is not None
+        fparams = fmtmatch.groupdict()
+        if fparams['prefix'] == None:  # noqa: E711
+            signed = False
+        elif fparams['prefix'] == '+':
+            signed = True
+        else:
+            raise ValueError
+        if fparams['fill'] == None:  # noqa: E711
+            dofill = False
+            fillmode = 0
+        elif fparams['fill'] == '0':
+            dofill = True
+            fillmode = 1
+        elif fparams['fill'] == ' ':
+            dofill = True
+            fillmode = 0
+        else:
+            raise ValueError
+        wholedigits, trailingdigits = int(fparams['digits'] or 1), int(fparams['precision'] or 0)
+        inum = round(value * 10 ** trailingdigits)
+        self._send(
+            Commands.DRAW_NUMBER, "BHHBB2Hq",
+            (bool(bg_color is not None) << 7) | (signed << 6) | (dofill << 5) | (fillmode << 4) | (int(font) & 0b1111),
+            fg_color, bg_color or 0, wholedigits, trailingdigits, *_p(pos), inum,
+        )
+
+
+def frame(screen):
+    font = screen.Font.EIGHT_X_SIXTEEN
+    screen.begin_frame()
+    screen.clear_screen(0)
+    for x, y, icon, text in [(10, 50, 1, "Print"), (140, 50, 7, "Prepare"), (10, 200, 3, "Calibrate"), (140, 200, 5, "Admin")]:
+        screen.draw_rect(0, 0xFFFF, (x, y), (x + 114, y + 104))
+        screen.draw_icon((x + 2, y + 2), 9, icon)
+        screen.draw_text((x + 20, y + 57), font, text, fg_color=0xFFFF, bg_color=None, monospace=True)
+    for inset, color in enumerate((0xFFFF, 0x0000, 0xF800)):
+        screen.draw_rect(1, color, (36 + inset, 410 + inset), (236 - inset, 450 - inset))
+    screen.draw_text((91, 420), screen.Font.TEN_X_TWENTY, "Power Off", fg_color=0, bg_color=None, monospace=True)
+    screen.draw_rect(1, 0x10E4, (0, 0), (271, 19))
+    screen.draw_text((56, 0), screen.Font.TEN_X_TWENTY, "192.168.100.200", fg_color=0xFFFF, bg_color=None, monospace=True)
+    for i, value in enumerate((210.5, 60.1, 99.9, 100)):
+        screen.draw_number((10, 320 + 20 * i), font, "03.1", value, fg_color=0xFFFF, bg_color=0)
+    screen.commit()
+
+
+def rendered_frame(screen):
+    """
+    Record the frame, then send it, as the renderer does.
+    """
+    recording = DisplayList()
+    screen.recorder = recording
+    frame(screen)
+    screen.recorder = None
+    screen.begin_frame()
+    for entry in recording:
+        screen.send_raw(entry.body)
+    screen.commit()
+
+
+def compare(title, runs, number):
+    """
+    Time each of ``runs``, name -> (screen, how to draw a frame on it).
+    """
+    print(title)
+    results = {name: [] for name in runs}
+    # Interleave the runs, so background load hits both alike
+    for _ in range(7):
+        for name, (screen, draw) in runs.items():
+            results[name].append(timeit.timeit(lambda: draw(screen), number=number))
+    for name, times in results.items():
+        results[name] = min(times) / number * 1e6
+        print(f"{name:>8}: {results[name]:8.1f} µs/frame")
+    print(f" speedup: {results['legacy'] / results['current']:8.2f}x")
+
+
+def main(number=2000):
+    legacy = LegacyEncoder(NullPort())
+    compare(
+        "Sending directly",
+        {"legacy": (legacy, frame), "current": (T5UIC1_LCD(NullPort()), frame)},
+        number,
+    )
+    for crc in (False, True):
+        compare(
+            f"Recording and replaying, CRC {'on' if crc else 'off'}, against the original sending directly",
+            {"legacy": (legacy, frame), "current": (T5UIC1_LCD(NullPort(), crc=crc), rendered_frame)},
+            number,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+End-to-end frame latency against the emulated panel.
+
+Sends a frame shaped like the main menu to a
+:class:`~pintail.systems.dwin_emulator.PanelEmulator` at 115200 baud, and
+measures how long it takes from the start of encoding until the panel has
+drawn its COMMIT, with and without the writer thread.
+
+A pty takes writes into a large buffer and drains instantly, so how long the
+caller is blocked is only meaningful on real hardware.
+
+Needs no hardware; run it anywhere with ``python3 benchmarks/frame_latency.py``.
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pintail.systems.dwin_screen import T5UIC1_LCD  # noqa: E402
+from pintail.systems.dwin_emulator import PanelEmulator  # noqa: E402
+from encode import frame  # noqa: E402
+
+
+def measure(screen, panel, number):
+    latencies = []
+    blocked = []
+    for _ in range(number):
+        count = panel.commits + 1
+        start = time.perf_counter()
+        frame(screen)
+        blocked.append(time.perf_counter() - start)
+        panel.wait_commit(count, timeout=5)
+        latencies.append(panel.last_commit - start)
+    return latencies, blocked
+
+
+def main(number=20):
+    with PanelEmulator() as panel:
+        screen = T5UIC1_LCD(panel.path)
+        for name in ("direct", "writer"):
+            if name == "writer":
+                screen.start_writer()
+            latencies, blocked = measure(screen, panel, number)
+            print(
+                f"{name:>8}: latency median {statistics.median(latencies) * 1e3:6.1f} ms, "
+                f"max {max(latencies) * 1e3:6.1f} ms; caller blocked {statistics.median(blocked) * 1e3:6.1f} ms"
+            )
+        screen.close()
+
+
+if __name__ == '__main__':
+    main()
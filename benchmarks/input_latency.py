@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Knob-to-pixel latency while Moonraker notifications pour in.
+
+Runs the engine and renderer against a
+:class:`~pintail.systems.dwin_emulator.PanelEmulator`, with a thread
+signalling bursts of notifications that each take a couple of milliseconds
+to handle,
+and turns the knob on a scroll list. Latency is from signalling the
+``KnobTurn`` until the panel has drawn the frame showing it, with the
+priority event queue and with a plain FIFO, and with the engine on an
+asyncio loop.
+
+Needs no hardware; run it anywhere with ``python3 benchmarks/input_latency.py``.
+"""
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import ppb  # noqa: E402
+from ppb import Vector as V  # noqa: E402
+from ppb.eventqueue import Priority, PriorityEventQueue  # noqa: E402
+from pintail import events, ui  # noqa: E402
+from pintail.systems.dwin_emulator import PanelEmulator  # noqa: E402
+from pintail.systems.render import DwinRender  # noqa: E402
+
+
+class Busy(ui.Scene):
+    """
+    A scroll list, and notifications that cost CPU.
+    """
+    cost = 0.002
+
+    def on_scene_started(self, event, signal):
+        self.children.add(ui.ScrollList(
+            items=tuple(f"Item {i}" for i in range(100)), position=V(136, 240), width=200, knobindex=0,
+        ))
+
+    def redraw(self, screen):
+        screen.clear_screen(0)
+
+    def on_moonraker_notification(self, event, signal):
+        end = time.perf_counter() + self.cost
+        while time.perf_counter() < end:
+            pass
+
+
+def run(panel, fifo, use_asyncio=False, turns=40, rate=300, burst=30):
+    engine = ppb.GameEngine(Busy, systems=[DwinRender], screen_port=panel.path)
+    for kind in (events.KnobPress, events.KnobRelease, events.KnobTurn):
+        engine.set_priority(kind, Priority.INPUT)
+    engine.set_priority(events.MoonrakerNotification, Priority.BACKGROUND)
+    if fifo:
+        # Everything the same priority
+        engine.eventqueue = PriorityEventQueue({})
+    latencies = []
+    done = threading.Event()
+
+    def notify():
+        # Moonraker tends to send status updates in bursts
+        while not done.is_set():
+            for _ in range(burst):
+                engine.signal(events.MoonrakerNotification(name="notify_status_update", params=[]))
+            time.sleep(burst / rate)
+
+    def knob():
+        time.sleep(1)
+        for i in range(turns):
+            count = panel.commits
+            start = time.perf_counter()
+            engine.signal(events.KnobTurn(direction=events.Direction.CW))
+            if panel.wait_commit(count + 1, timeout=5):
+                latencies.append(panel.last_commit - start)
+            # Land at different points in the bursts
+            time.sleep(0.1 + 0.007 * i)
+        done.set()
+        engine.signal(ppb.events.Quit())
+
+    for target in (notify, knob):
+        threading.Thread(target=target, daemon=True).start()
+    if use_asyncio:
+        engine.run_async()
+    else:
+        engine.run()
+    return latencies
+
+
+def main():
+    for name, fifo, use_asyncio in (("fifo", True, False), ("priority", False, False), ("asyncio", False, True)):
+        with PanelEmulator() as panel:
+            latencies = run(panel, fifo, use_asyncio)
+        print(
+            f"{name:>8}: knob to pixel median {statistics.median(latencies) * 1e3:6.1f} ms, "
+            f"max {max(latencies) * 1e3:6.1f} ms ({len(latencies)} turns)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of broadcasting an event through GameEngine.publish.
+
+Builds scenes of increasing size, where one sprite in ten handles the event
+and the rest are inert, and compares publishing through the subscriber index
+with the original dispatch, which walked the whole tree and looked up the
+handler on every object.
+
+Run on the printer's Pi with ``just py benchmarks/publish.py``.
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import ppb  # noqa: E402
+from ppb.engine import GameEngine, _get_handler_name  # noqa: E402
+from ppb.gomlib import walk  # noqa: E402
+
+
+class Tick:
+    __targets__ = None
+
+
+class Inert(ppb.Sprite):
+    pass
+
+
+class Listener(ppb.Sprite):
+    ticks = 0
+
+    def on_tick(self, event, signal):
+        self.ticks += 1
+
+
+def legacy_publish(engine, event):
+    """
+    Dispatch as it was before the subscriber index.
+    """
+    event.scene = engine.current_scene
+    name = _get_handler_name(type(event).__name__)
+    for obj in walk(engine):
+        method = getattr(obj, name, None)
+        if callable(method):
+            method(event, engine.signal)
+
+
+def build(size):
+    scene = ppb.Scene()
+    for i in range(size):
+        scene.add(Listener() if i % 10 == 0 else Inert())
+    engine = GameEngine(scene, basic_systems=())
+    engine.children.push_scene(scene)
+    return engine
+
+
+def main(number=2000):
+    print(f"{'objects':>8} {'legacy':>12} {'indexed':>12} {'speedup':>8}")
+    for size in (10, 50, 200, 1000):
+        engine = build(size)
+        event = Tick()
+        results = {"legacy": [], "indexed": []}
+        # Interleave the runs, so background load hits both alike
+        for _ in range(5):
+            results["legacy"].append(timeit.timeit(lambda: legacy_publish(engine, event), number=number))
+            results["indexed"].append(timeit.timeit(lambda: engine.publish(event), number=number))
+        legacy, indexed = (min(results[k]) / number * 1e6 for k in ("legacy", "indexed"))
+        print(f"{size:>8} {legacy:>9.1f} µs {indexed:>9.1f} µs {legacy / indexed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the object tree: walking it, removing tagged objects from
+it, and publishing while objects come and go.
+
+Each compares the cached traversal and reverse tag map in ppb.gomlib with the
+original code, which walked the tree breadth first with a fresh copy of every
+child set, and searched every tag set on removal. When publishing, the
+original code also rebuilt the subscriber index from a walk after every
+change, where it is now updated as objects come and go.
+
+Run on the printer's Pi with ``just py benchmarks/tree.py``.
+"""
+import sys
+import timeit
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import ppb  # noqa: E402
+import ppb.engine  # noqa: E402
+from ppb.engine import GameEngine  # noqa: E402
+from ppb.gomlib import Children, walk  # noqa: E402
+
+SIZES = (10, 50, 200, 1000)
+
+
+class Tick:
+    __targets__ = None
+
+
+class Item(ppb.Sprite):
+    pass
+
+
+class Listener(ppb.Sprite):
+    ticks = 0
+
+    def on_tick(self, event, signal):
+        self.ticks += 1
+
+
+def legacy_walk(root):
+    """
+    Walk as it was before the cached traversal.
+    """
+    q = deque([root])
+    while q:
+        cur = q.popleft()
+        yield cur
+        if hasattr(cur, 'children'):
+            if type(cur.children) is Children:
+                q.extend(list(cur.children._all))
+            else:
+                # The engine's children, which iterated live
+                q.extend(cur.children)
+
+
+def legacy_remove(children, child):
+    """
+    Remove as it was before the reverse tag map.
+    """
+    children._all.remove(child)
+    for kind in type(child).mro():
+        children._kinds[kind].remove(child)
+    for s in children._tags.values():
+        s.discard(child)
+    children._child_tags.pop(child, None)
+    children._changed()
+
+
+def drop_subscribers(engine):
+    """
+    Throw away the engine's subscriber index, so the next publish rebuilds it.
+    """
+    engine._subscribers = None
+    engine._subscribed = {}
+    engine._subscriber_lists = {}
+
+
+def build(size):
+    """
+    A scene of ``size`` sprites, in groups of ten under a parent sprite, each
+    tagged with its own name.
+    """
+    scene = ppb.Scene()
+    parent = None
+    for i in range(size):
+        if i % 10 == 0:
+            parent = scene.add(Listener(), tags=(f"group{i}",))
+        else:
+            parent.add(Item(), tags=(f"item{i}",))
+    engine = GameEngine(scene, basic_systems=())
+    engine.children.push_scene(scene)
+    return engine, scene
+
+
+def compare(label, legacy, cached, number):
+    results = {"legacy": [], "cached": []}
+    # Interleave the runs, so background load hits both alike
+    for _ in range(5):
+        results["legacy"].append(timeit.timeit(legacy, number=number))
+        results["cached"].append(timeit.timeit(cached, number=number))
+    old, new = (min(results[k]) / number * 1e6 for k in ("legacy", "cached"))
+    print(f"{label:>8} {old:>9.1f} µs {new:>9.1f} µs {old / new:>7.2f}x")
+
+
+def churn(scene, remove):
+    """
+    Take a tagged sprite out of the scene and put it back.
+    """
+    child = next(iter(scene.children._all))
+    remove(scene.children, child)
+    scene.children.add(child, tags=("churn",))
+
+
+def bench_walk(number=500):
+    print("walk the whole tree")
+    for size in SIZES:
+        engine, _ = build(size)
+        compare(size, lambda: deque(legacy_walk(engine), 0), lambda: deque(walk(engine), 0), number)
+
+
+def bench_remove(number=2000):
+    print("remove and re-add a tagged object")
+    for size in SIZES:
+        _, scene = build(size)
+        # Every sprite's tags live in the scene's own children
+        for child in list(scene.children):
+            scene.children.remove(child)
+        for i in range(size):
+            scene.children.add(Item(), tags=(f"item{i}", "all"))
+        compare(
+            size,
+            lambda: churn(scene, legacy_remove),
+            lambda: churn(scene, lambda children, child: children.remove(child)),
+            number,
+        )
+
+
+def bench_publish(number=500):
+    print("publish after the tree changes")
+    for size in SIZES:
+        engine, scene = build(size)
+        event = Tick()
+
+        def legacy():
+            churn(scene, legacy_remove)
+            # The subscriber index was rebuilt from a walk after every change
+            drop_subscribers(engine)
+            ppb.engine.walk = legacy_walk
+            engine.publish(event)
+
+        def cached():
+            churn(scene, lambda children, child: children.remove(child))
+            ppb.engine.walk = walk
+            engine.publish(event)
+
+        compare(size, legacy, cached, number)
+        ppb.engine.walk = walk
+
+
+def main():
+    print(f"{'objects':>8} {'legacy':>12} {'cached':>12} {'speedup':>8}")
+    bench_walk()
+    bench_remove()
+    bench_publish()
+
+
+if __name__ == '__main__':
+    main()
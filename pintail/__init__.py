@@ -1,4 +1,5 @@
 import logging
+import os
 
 import ppb
 
@@ -14,10 +15,22 @@ from .off_scene import OffScene
 def run():
     logging.basicConfig(level=logging.INFO)
 
-    with ppb.GameEngine(
+    eng = ppb.GameEngine(
         DisconnectedScene(next=MainMenuScene), 
         systems=[Signals, Moonraker, DwinRender, Input, GlobalSceneChanges], 
         time_step=1.0,
+        # Bursts of notifications share one Idle, but never hold up input
+        # frames (see DwinRender.max_input_fps)
+        idle_when_drained=True,
+        idle_interval=1 / 60,
         off_scene=OffScene,
-    ) as eng:
+        # Such as the device printed by ``python -m pintail.systems.dwin_emulator``
+        screen_port=os.environ.get('PINTAIL_SCREEN'),
+        # Handler timings, logged on SIGUSR1
+        profile=bool(os.environ.get('PINTAIL_PROFILE')),
+    )
+    if os.environ.get('PINTAIL_LOOP') == 'asyncio':
+        # One thread for the engine, the knob, moonraker, and timers
+        eng.run_async()
+    else:
         eng.run()
\ No newline at end of file
@@ -20,6 +20,8 @@ class UiDirtied:
 @dataclass
 class Render:
     screen: typing.Any
+    #: Where drawing is being recorded, if anywhere
+    display_list: typing.Any = None
 
 @dataclass
 class KnobPress:
@@ -36,6 +38,8 @@ class Direction(enum.IntEnum):
 @dataclass
 class KnobTurn:
     direction: Direction
+    #: Detents turned at once, when the knob outruns the input device
+    steps: int = 1
 
 @dataclass
 class Focus:
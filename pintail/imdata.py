@@ -111,3 +111,11 @@ ICONS = {
     90: Icon(width=110, height=100),
     91: Icon(width=110, height=100),
 }
+
+#: Horizontal advance of each character in proportional text, by font size
+#: code (see :class:`~pintail.systems.dwin_screen.Font`) then character.
+#: Characters and fonts not listed here advance by the full cell width, same
+#: as monospace. Nothing has been measured on a panel yet, so this is empty,
+#: and proportional layouts are only right if no glyph is wider than its cell,
+#: which hasn't been checked.
+GLYPH_ADVANCES: dict[int, dict[str, int]] = {}
@@ -2,6 +2,7 @@ import ppb
 from ppb import Vector as V
 
 from . import ui, uibits, netinfo, netscene, prepare_menu, imdata
+from .textlayout import measure_text
 
 
 class IconButton(ui.Sprite):
@@ -21,7 +22,7 @@ class IconButton(ui.Sprite):
         return imdata.ICONS[self.icon].height + 4
 
     def _offset(self, font):
-        text_width = len(self.text) * font.x
+        text_width = measure_text(font, self.text)
         return (self.width - text_width) / 2
 
     def redraw(self, screen):
@@ -60,8 +61,9 @@ class NetworkBar(ui.Sprite):
         super().__init__(**props)
         self.ipaddr = netinfo.get_default_address()
 
-    def on_update(self, event, signal):
-        self.ipaddr = netinfo.get_default_address()
+    def on_timer(self, event, signal):
+        if event.name == "netinfo":
+            self.ipaddr = netinfo.get_default_address()
 
     def redraw(self, screen):
         font = screen.Font.s(*self.font)
@@ -71,7 +73,7 @@ class NetworkBar(ui.Sprite):
         self.left = 0
 
         text = str(self.ipaddr)
-        text_width = len(text) * font.x
+        text_width = measure_text(font, text)
         text_x = (self.width - text_width) / 2
 
         bg = self.focus_color if self.has_focus else self.bg_color
@@ -111,7 +113,7 @@ class PowerButton(ui.Sprite):
     def redraw(self, screen):
         font = screen.Font.s(*self.font)
         rect = uibits.BorderRect.from_sprite(self, border=self.border, padding=self.padding)
-        text_tl, _ = rect.center_real_content((len(self.text) * font.x, font.y))
+        text_tl, _ = rect.center_real_content((measure_text(font, self.text), font.y))
 
         border_color = self.border_color if self.has_focus else self.padding_color
         padding_color = self.padding_color
@@ -159,10 +161,11 @@ class MainMenuScene(ui.Scene):
             padding_color=self.bg_color, knobindex=4,
         ))
 
-        self.children.add(NetworkBar(
+        netbar = self.children.add(NetworkBar(
             bg_color=imdata.BTN_NORMAL_BG, focus_color=imdata.BTN_FOCUS_BG,
             fg_color=0xFFFFFF, knobindex=5,
         ))
+        event.timers.every(30, "netinfo", owner=netbar)
 
     def redraw(self, screen):
         screen.clear_screen(screen.RGB(self.bg_color))
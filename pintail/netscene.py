@@ -2,6 +2,7 @@ import ppb
 from ppb import Vector as V
 
 from . import ui, uibits, netinfo
+from .textlayout import measure_text
 
 
 class NetScene(ui.Scene):
@@ -14,11 +15,16 @@ class NetScene(ui.Scene):
         self.mainaddr = netinfo.get_default_address()
         self.hostname = netinfo.hostname()
         self.alladdrs = frozenset(inter.ip for inter in netinfo.iter_all_interfaces() if inter.version == 4)
+        event.timers.every(30, "netinfo", owner=self)
 
-    def on_update(self, event, signal):
-        self.mainaddr = netinfo.get_default_address()
-        self.hostname = netinfo.hostname()
-        self.alladdrs = frozenset(inter.ip for inter in netinfo.iter_all_interfaces() if inter.version == 4)
+    def on_scene_stopped(self, event, signal):
+        event.timers.cancel("netinfo", owner=self)
+
+    def on_timer(self, event, signal):
+        if event.name == "netinfo":
+            self.mainaddr = netinfo.get_default_address()
+            self.hostname = netinfo.hostname()
+            self.alladdrs = frozenset(inter.ip for inter in netinfo.iter_all_interfaces() if inter.version == 4)
 
     def redraw(self, screen):
         additional_addrs = sorted(self.alladdrs - {self.mainaddr})
@@ -44,7 +50,7 @@ class NetScene(ui.Scene):
 
         text_y = qr_top - qr_pixels
         for text in all_urls:
-            text_width = len(text) * font.x
+            text_width = measure_text(font, text)
             text_x = (screen.width - text_width) / 2
             screen.draw_text(
                 V(text_x, text_y), font, text, 
@@ -17,6 +17,7 @@ class OffScene(uibits.PopupMsg):
     #    D              E                       F                  G
 
     def on_scene_started(self, event, signal):
+        event.timers.every(1, "recheck", owner=self)
         # Recreate where we are in the above state machine
         status = event.moonraker("machine.device_power.get_device", device=self.printer_device)
         power = status[self.printer_device]
@@ -49,7 +50,9 @@ class OffScene(uibits.PopupMsg):
                 # Powered off, shutdown is coming
                 pass
 
-    def on_update(self, event, signal):
+    def on_timer(self, event, signal):
+        if event.name != "recheck":
+            return
         # We sometimes get into weird states, mostly when the user clicks excessively.
         # This is a fallback.
         try:
@@ -86,4 +89,5 @@ class OffScene(uibits.PopupMsg):
         assert resp[self.printer_device] == "on"
 
     def on_scene_stopped(self, event, signal):
+        event.timers.cancel("recheck", owner=self)
         signal(events.DisplayOn())
@@ -0,0 +1,406 @@
+"""
+Records what each widget draws in a frame, so that commands the screen is
+already showing are not sent again.
+"""
+import collections
+import contextlib
+import struct
+import typing
+import weakref
+
+from .dwin_screen import T5UIC1_LCD, Commands, Font, RectMode
+from .. import imdata
+
+
+#: left, top, right, bottom in screen pixels; right and bottom are exclusive
+Rect = tuple[int, int, int, int]
+
+SCREEN: Rect = (0, 0, T5UIC1_LCD.width, T5UIC1_LCD.height)
+
+#: Commands that produce the same pixels no matter how often they're repeated
+_REPEATABLE = frozenset({
+    Commands.CLEAR_SCREEN,
+    Commands.DRAW_POINT,
+    Commands.DRAW_LINE,
+    Commands.DRAW_RECT,
+    Commands.DRAW_TEXT,
+    Commands.DRAW_NUMBER,
+    Commands.DRAW_QR_CODE,
+    Commands.DRAW_JPEG,
+    Commands.DRAW_ICON,
+})
+
+#: Commands that don't touch pixels
+_NO_PIXELS = frozenset({
+    Commands.HANDSHAKE,
+    Commands.BACKLIGHT_BRIGHTNESS_ADJUSTMENT,
+    Commands.WRITE_DATA_MEMORY,
+    Commands.READ_DATA_MEMORY,
+    Commands.WRITE_PICTURE_MEMORY,
+    Commands.SET_ANIM,
+    Commands.COMMIT,
+})
+
+# The largest QR code the panel will draw, in cells
+_QR_CELLS = 46
+
+
+def _span(a: int, b: int, c: int, d: int) -> Rect:
+    """
+    Normalize two inclusive corners into a Rect.
+    """
+    return min(a, c), min(b, d), max(a, c) + 1, max(b, d) + 1
+
+
+def _font(flags: int) -> typing.Union[Font, None]:
+    try:
+        return Font(flags & 0b1111)
+    except ValueError:
+        return None
+
+
+def packet_bounds(body: bytes) -> typing.Union[Rect, None]:
+    """
+    Work out the area of the screen a packet body can change.
+
+    Returns None for packets that don't draw. Packets we can't make sense of
+    are assumed to cover the whole screen.
+    """
+    cmd = body[0]
+    try:
+        if cmd in _NO_PIXELS:
+            return None
+        elif cmd == Commands.DRAW_LINE:
+            _, x0, y0, x1, y1 = struct.unpack_from('>H2H2H', body, 1)
+            return _span(x0, y0, x1, y1)
+        elif cmd == Commands.DRAW_RECT:
+            _, _, x0, y0, x1, y1 = struct.unpack_from('>BH2H2H', body, 1)
+            return _span(x0, y0, x1, y1)
+        elif cmd == Commands.MOVE_REGION:
+            _, _, _, x0, y0, x1, y1 = struct.unpack_from('>BHH2H2H', body, 1)
+            return _span(x0, y0, x1, y1)
+        elif cmd == Commands.DRAW_POINT:
+            _, w, h = struct.unpack_from('>H2B', body, 1)
+            coords = struct.unpack_from(f'>{(len(body) - 5) // 2}H', body, 5)
+            xs, ys = coords[0::2], coords[1::2]
+            return min(xs), min(ys), max(xs) + w, max(ys) + h
+        elif cmd == Commands.DRAW_TEXT:
+            flags, _, _, x, y = struct.unpack_from('>BHH2H', body, 1)
+            font = _font(flags)
+            if font is None:
+                return SCREEN
+            # Proportional text is never wider than monospace
+            length = len(body[10:].decode('utf-8', errors='replace'))
+            return x, y, x + length * font.x, y + font.y
+        elif cmd == Commands.DRAW_NUMBER:
+            flags, _, _, whole, frac, x, y = struct.unpack_from('>BHHBB2H', body, 1)
+            font = _font(flags)
+            if font is None:
+                return SCREEN
+            # Allow for a sign and a decimal point
+            chars = 1 + whole + (frac + 1 if frac else 0)
+            return x, y, x + chars * font.x, y + font.y
+        elif cmd == Commands.DRAW_ICON:
+            x, y, lib, icon = struct.unpack_from('>2HBB', body, 1)
+            if lib & 0x7F != 9 or icon not in imdata.ICONS:
+                return SCREEN
+            info = imdata.ICONS[icon]
+            return x, y, x + info.width, y + info.height
+        elif cmd == Commands.DRAW_ICON_ANIM:
+            x, y, _, lib, first, last = struct.unpack_from('>2HBBBB', body, 1)
+            icons = [imdata.ICONS.get(i) for i in range(min(first, last), max(first, last) + 1)]
+            if lib != 9 or None in icons:
+                return SCREEN
+            return x, y, x + max(i.width for i in icons), y + max(i.height for i in icons)
+        elif cmd == Commands.DRAW_BUFFER2:
+            _, x0, y0, x1, y1, x, y = struct.unpack_from('>B2H2H2H', body, 1)
+            return x, y, x + abs(x1 - x0) + 1, y + abs(y1 - y0) + 1
+        elif cmd == Commands.DRAW_QR_CODE:
+            x, y, size = struct.unpack_from('>2HB', body, 1)
+            return x, y, x + size * _QR_CELLS, y + size * _QR_CELLS
+    except (struct.error, ValueError):
+        pass
+    return SCREEN
+
+
+def is_repeatable(body: bytes) -> bool:
+    """
+    Does sending this packet twice give the same pixels as sending it once?
+    """
+    if body[0] == Commands.DRAW_RECT:
+        return body[1] != RectMode.XOR
+    return body[0] in _REPEATABLE
+
+
+def framed_size(body: bytes) -> int:
+    """
+    The number of bytes a packet body takes on the wire.
+    """
+    return len(T5UIC1_LCD.PACKET_HEAD) + len(body) + len(T5UIC1_LCD.PACKET_TAIL)
+
+
+def overlaps(a: typing.Union[Rect, None], b: typing.Union[Rect, None]) -> bool:
+    if a is None or b is None:
+        return False
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class Entry:
+    """
+    A single recorded command.
+    """
+    __slots__ = 'owner', 'body', 'bounds', 'intact'
+
+    def __init__(self, owner, body: bytes):
+        self.owner = owner
+        self.body = body
+        self.bounds = packet_bounds(body)
+        #: False once something else has been drawn over this
+        self.intact = True
+
+    def __repr__(self):
+        return f"<Entry {self.owner!r} {self.body.hex()} intact={self.intact}>"
+
+
+class DisplayList:
+    """
+    All the commands drawn in a frame, in order, along with who drew them.
+
+    Use as the screen's ``recorder``.
+    """
+    def __init__(self):
+        self.entries: list[Entry] = []
+        self._owner = None
+
+    @contextlib.contextmanager
+    def drawing(self, owner):
+        """
+        Attribute everything recorded in the block to ``owner``.
+        """
+        prev, self._owner = self._owner, owner
+        try:
+            yield
+        finally:
+            self._owner = prev
+
+    def record(self, body: bytes):
+        self.entries.append(Entry(self._owner, bytes(body)))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+class DisplayDiffer:
+    """
+    Remembers what each owner last drew, and works out which commands of a new
+    frame actually need to be sent.
+
+    A command is skipped when its owner drew the identical command at the same
+    place in its list last time, and the pixels it produced haven't been
+    touched since: nothing sent this frame overlaps it, no other owner has
+    drawn over it, and none of the owner's own later commands that overlap it
+    have changed.
+    """
+    def __init__(self):
+        self._records = weakref.WeakKeyDictionary()
+
+    def reset(self):
+        """
+        Forget everything; the next frame is sent in full.
+        """
+        self._records.clear()
+
+    def _damage(self, bounds: Rect, owner, pending: dict):
+        """
+        Mark the entries of other owners under ``bounds`` as painted over.
+        """
+        for records in (self._records, pending):
+            for other, entries in records.items():
+                if other is owner:
+                    continue
+                for entry in entries:
+                    if entry.intact and overlaps(entry.bounds, bounds):
+                        entry.intact = False
+
+    def _can_skip(self, index: int, entry: Entry, previous: list[Entry], current: list[Entry], sent: list[Rect]) -> bool:
+        if index >= len(previous) or entry.bounds is None or not is_repeatable(entry.body):
+            return False
+        old = previous[index]
+        if old.body != entry.body or not old.intact:
+            return False
+        if any(overlaps(entry.bounds, b) for b in sent):
+            return False
+        # The owner's own later commands last time were drawn over this one; if
+        # any of those have changed, the old pixels here are no longer right.
+        for j in range(index + 1, len(previous)):
+            later = previous[j]
+            if overlaps(entry.bounds, later.bounds):
+                if j >= len(current) or current[j].body != later.body:
+                    return False
+        return True
+
+    def diff(self, frame: DisplayList) -> tuple[list[Entry], int]:
+        """
+        Compare a frame against what's on screen.
+
+        Returns the entries to send, in order, and the number of bytes
+        skipped.
+        """
+        by_owner = collections.defaultdict(list)
+        for entry in frame:
+            if entry.owner is not None:
+                by_owner[entry.owner].append(entry)
+
+        send = []
+        skipped = 0
+        sent_bounds = []
+        pending = {}
+        counters = collections.Counter()
+
+        for entry in frame:
+            owner = entry.owner
+            if owner is not None:
+                index = counters[owner]
+                counters[owner] += 1
+                previous = self._records.get(owner, ())
+                if self._can_skip(index, entry, previous, by_owner[owner], sent_bounds):
+                    skipped += framed_size(entry.body)
+                    pending.setdefault(owner, []).append(previous[index])
+                    continue
+                pending.setdefault(owner, []).append(entry)
+
+            send.append(entry)
+            if entry.bounds is not None:
+                sent_bounds.append(entry.bounds)
+                self._damage(entry.bounds, owner, pending)
+
+        for owner, entries in pending.items():
+            self._records[owner] = entries
+
+        return send, skipped
+
+
+def contains(outer: typing.Union[Rect, None], inner: typing.Union[Rect, None]) -> bool:
+    if outer is None or inner is None:
+        return False
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+_RECT_BODY = struct.Struct('>BBH2H2H')
+_LINE_BODY = struct.Struct('>BH2H2H')
+_CLEAR_BODY = struct.Struct('>BH')
+
+
+def _filled_rect(body: bytes) -> typing.Union[tuple[int, Rect], None]:
+    """
+    The color and bounds of a filled rectangle, or None if it's not one.
+    """
+    if body[0] != Commands.DRAW_RECT or body[1] != RectMode.FILLED or len(body) != _RECT_BODY.size:
+        return None
+    _, _, color, x0, y0, x1, y1 = _RECT_BODY.unpack(body)
+    return color, _span(x0, y0, x1, y1)
+
+
+def _opaque(entry: Entry) -> bool:
+    """
+    Does this paint over every pixel in its bounds?
+    """
+    cmd = entry.body[0]
+    return cmd in (Commands.CLEAR_SCREEN, Commands.DRAW_JPEG) or _filled_rect(entry.body) is not None
+
+
+def _rect_body(color: int, rect: Rect) -> bytes:
+    """
+    The cheapest packet that fills ``rect`` with ``color``.
+    """
+    left, top, right, bottom = rect
+    if rect == SCREEN:
+        return _CLEAR_BODY.pack(Commands.CLEAR_SCREEN, color)
+    elif right - left == 1 or bottom - top == 1:
+        # A line is a byte shorter than a rectangle
+        return _LINE_BODY.pack(Commands.DRAW_LINE, color, left, top, right - 1, bottom - 1)
+    return _RECT_BODY.pack(Commands.DRAW_RECT, RectMode.FILLED, color, left, top, right - 1, bottom - 1)
+
+
+def _merged(a: Rect, b: Rect) -> typing.Union[Rect, None]:
+    """
+    The union of two rects, if it's a rect.
+    """
+    if a[0] == b[0] and a[2] == b[2] and a[1] <= b[3] and b[1] <= a[3]:
+        return a[0], min(a[1], b[1]), a[2], max(a[3], b[3])
+    if a[1] == b[1] and a[3] == b[3] and a[0] <= b[2] and b[0] <= a[2]:
+        return min(a[0], b[0]), a[1], max(a[2], b[2]), a[3]
+    return None
+
+
+def _cull(entries: list[Entry]) -> list[Entry]:
+    """
+    Drop anything completely painted over by a later opaque command.
+    """
+    kept = []
+    for i, entry in enumerate(entries):
+        if entry.bounds is not None and is_repeatable(entry.body):
+            for later in entries[i + 1:]:
+                if not overlaps(entry.bounds, later.bounds):
+                    continue
+                if _opaque(later) and contains(later.bounds, entry.bounds):
+                    break
+                if not is_repeatable(later.body):
+                    # Depends on what's there (XOR, moves); keep it there
+                    kept.append(entry)
+                    break
+            else:
+                kept.append(entry)
+        else:
+            kept.append(entry)
+    return kept
+
+
+def _merge_rects(entries: list[Entry]) -> list[Entry]:
+    """
+    Combine same-colored filled rectangles that together make a rectangle.
+    """
+    entries = list(entries)
+    i = 0
+    while i < len(entries):
+        first = _filled_rect(entries[i].body)
+        if first is None:
+            i += 1
+            continue
+        color, rect = first
+        for j in range(i + 1, len(entries)):
+            other = _filled_rect(entries[j].body)
+            merged = other is not None and other[0] == color and _merged(rect, other[1])
+            # Drawing the later rect early is only safe if nothing in between
+            # touches it
+            if merged and not any(overlaps(other[1], e.bounds) for e in entries[i + 1:j]):
+                rect = merged
+                entries[i] = Entry(entries[i].owner, _RECT_BODY.pack(Commands.DRAW_RECT, RectMode.FILLED, color, rect[0], rect[1], rect[2] - 1, rect[3] - 1))
+                del entries[j]
+                break
+        else:
+            i += 1
+    return entries
+
+
+def optimize(entries: list[Entry]) -> tuple[list[Entry], int]:
+    """
+    Find a cheaper list of commands that leaves the same pixels.
+
+    Drops commands that later opaque ones paint over, merges filled
+    rectangles, and picks the shortest encoding for each fill.
+
+    Returns the new entries and the number of bytes saved.
+    """
+    before = sum(framed_size(e.body) for e in entries)
+    entries = _merge_rects(_cull(entries))
+    for i, entry in enumerate(entries):
+        fill = _filled_rect(entry.body)
+        if fill is not None:
+            body = _rect_body(*fill)
+            if body != entry.body:
+                entries[i] = Entry(entry.owner, body)
+    return entries, before - sum(framed_size(e.body) for e in entries)
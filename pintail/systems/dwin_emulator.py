@@ -0,0 +1,199 @@
+"""
+A stand-in DWIN panel on a pseudo-terminal.
+
+Anything that can open a serial port, including the whole pintail stack, can
+talk to it as if it were the real screen: it answers handshakes, draws every
+packet into a :class:`~pintail.systems.dwin_model.PanelModel`, and reads no
+faster than the real 115200 baud link would carry the bytes.
+
+Run it on its own with ``python -m pintail.systems.dwin_emulator``, then
+point pintail at the printed device with ``PINTAIL_SCREEN``. With
+``--selftest``, it checks that replies make it back over the pty instead.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import tty
+import typing
+
+from .dwin_screen import T5UIC1_LCD
+from .dwin_model import ModelPort, PanelModel
+
+LOG = logging.getLogger(__name__)
+
+
+class PanelEmulator:
+    """
+    Emulates the panel on the far side of a pty.
+
+    Example: ::
+
+        with PanelEmulator() as panel:
+            screen = T5UIC1_LCD(panel.path)
+            ...
+            panel.wait_commit()
+            open('screen.png', 'wb').write(panel.model.to_png())
+    """
+    #: Bytes read from the pty at a time. Each read is held up for as long as
+    #: those bytes take on the wire, so smaller is more faithful.
+    read_size = 64
+
+    def __init__(self, model: typing.Union[PanelModel, None] = None, *, baud: typing.Union[int, None] = 115200, crc: bool = False):
+        """
+        Args:
+            model: What to draw into
+            baud: Link speed to simulate, or None to go as fast as possible
+            crc: Act like firmware that checks CRCs
+        """
+        self._port = ModelPort(model, crc=crc)
+        self.baud = baud
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        #: Device to open as the screen's serial port
+        self.path = os.ttyname(self._slave)
+        self._cond = threading.Condition()
+        #: Number of COMMITs drawn
+        self.commits = 0
+        #: :func:`time.perf_counter` when the last COMMIT was drawn
+        self.last_commit = None
+        self._closed = False
+        # Drawing happens on its own thread, so slow drawing doesn't slow down
+        # the simulated link
+        self._received = queue.Queue()
+        self._thread = threading.Thread(None, self._receive, name="dwin-emulator-rx", daemon=True)
+        self._thread.start()
+        self._draw_thread = threading.Thread(None, self._draw, name="dwin-emulator", daemon=True)
+        self._draw_thread.start()
+
+    @property
+    def model(self) -> PanelModel:
+        return self._port.model
+
+    @property
+    def bytes_received(self) -> int:
+        return self._port.bytes_written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        # Wakes the reader, once nothing else has the pty open
+        os.close(self._slave)
+        self._thread.join(1)
+        self._draw_thread.join(1)
+        os.close(self._master)
+
+    def wait_commit(self, count: typing.Union[int, None] = None, timeout: typing.Union[float, None] = None) -> bool:
+        """
+        Wait until ``count`` COMMITs have been drawn (by default, one more than
+        now).
+
+        Returns False if the timeout expired first.
+        """
+        with self._cond:
+            if count is None:
+                count = self.commits + 1
+            return self._cond.wait_for(lambda: self.commits >= count, timeout)
+
+    def _receive(self):
+        wire = time.perf_counter()
+        try:
+            while not self._closed:
+                try:
+                    data = os.read(self._master, self.read_size)
+                except OSError:
+                    # Closed
+                    return
+                if self.baud:
+                    # 8N1: ten bits on the wire for every byte
+                    wire = max(wire, time.perf_counter()) + len(data) * 10 / self.baud
+                    delay = wire - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._received.put(data)
+        finally:
+            self._received.put(None)
+
+    def _draw(self):
+        tail = T5UIC1_LCD.PACKET_TAIL
+        while (data := self._received.get()) is not None:
+            self._port.write(data)
+            if self._port.commits != self.commits:
+                with self._cond:
+                    self.commits = self._port.commits
+                    self.last_commit = time.perf_counter()
+                    self._cond.notify_all()
+
+            while reply := self._port.read_until(tail):
+                try:
+                    os.write(self._master, reply)
+                except OSError:
+                    return
+
+
+#: Data memory contents that look like framing: a head byte, and a tail
+#: that stops one byte short
+AWKWARD_DATA = T5UIC1_LCD.PACKET_HEAD + b"\x01\x02" + T5UIC1_LCD.PACKET_HEAD + T5UIC1_LCD.PACKET_TAIL[:-1] + b"\x03"
+
+
+def selftest(crc: bool = False) -> bool:
+    """
+    Write data memory that looks like framing, and read it back, both
+    waiting for the reply and through the reader thread.
+    """
+    ok = True
+    with PanelEmulator(baud=None, crc=crc) as panel:
+        screen = T5UIC1_LCD(panel.path)
+        try:
+            for threaded in (False, True):
+                if threaded:
+                    screen.start_reader()
+                screen.write_data_memory(0x20, AWKWARD_DATA)
+                try:
+                    data = screen.read_data_memory(0x20, len(AWKWARD_DATA)).result(2)
+                except Exception as exc:
+                    data = exc
+                passed = data == AWKWARD_DATA
+                ok &= passed
+                LOG.info(
+                    "%s: read back %r (%s, CRC %s)",
+                    "ok" if passed else "FAILED", data, "reader thread" if threaded else "waiting",
+                    "on" if screen.crc else "off",
+                )
+        finally:
+            screen.close()
+    return ok
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--png', help="Write the screen here after every commit")
+    parser.add_argument('--baud', type=int, default=115200, help="Link speed to simulate; 0 for unlimited")
+    parser.add_argument('--crc', action='store_true', help="Check CRCs, like firmware 2.3 and later")
+    parser.add_argument('--selftest', action='store_true', help="Check that replies survive the round trip, and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.selftest:
+        raise SystemExit(0 if selftest(args.crc) else 1)
+    with PanelEmulator(baud=args.baud or None, crc=args.crc) as panel:
+        print(panel.path, flush=True)
+        try:
+            while True:
+                if panel.wait_commit(timeout=1) and args.png:
+                    with open(args.png, 'wb') as f:
+                        f.write(panel.model.to_png())
+        except KeyboardInterrupt:
+            pass
+        LOG.info("Received %d bytes, %d commits", panel.bytes_received, panel.commits)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,623 @@
+"""
+A software model of the DWIN panel's framebuffer.
+
+Consumes the same packets :class:`~pintail.systems.dwin_screen.T5UIC1_LCD`
+sends, and keeps a 272x480 RGB565 copy of what the panel should be showing.
+This lets the renderer find exactly which pixels a command changes, and
+doubles as a stand-in screen when there's no hardware attached.
+
+The model doesn't have the panel's font ROM, icon library, or JPEG decoder.
+Glyphs, icons, pictures, and QR codes are drawn as deterministic stand-in
+patterns covering the same cells, so that drawing the same thing twice is a
+no-op and drawing something different is a change. Where stand-ins are, the
+model doesn't know the real pixels, so anything else drawn there counts as a
+change; see :attr:`PanelModel.stand_ins`.
+"""
+import array
+import functools
+import logging
+import struct
+import threading
+import typing
+import zlib
+
+from .dwin_screen import T5UIC1_LCD, Commands, Font, MoveDir, MoveMode, RectMode, packet_crc
+from .display_list import Rect, SCREEN, overlaps, packet_bounds
+from .. import imdata
+
+LOG = logging.getLogger(__name__)
+
+WIDTH = T5UIC1_LCD.width
+HEIGHT = T5UIC1_LCD.height
+
+
+#: Commands drawn with stand-ins for pixels we can't render
+_STAND_INS = frozenset({
+    Commands.DRAW_TEXT,
+    Commands.DRAW_NUMBER,
+    Commands.DRAW_ICON,
+    Commands.DRAW_JPEG,
+    Commands.DRAW_QR_CODE,
+})
+
+
+def _contains(outer: Rect, inner: Rect) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def _stand_in(*key) -> int:
+    """
+    Pick a stable "color" to stand in for content we can't render.
+    """
+    return zlib.crc32(repr(key).encode('utf-8')) & 0xFFFF
+
+
+@functools.lru_cache(maxsize=1024)
+def _glyph(font: Font, char: str) -> tuple[tuple[int, ...], ...]:
+    """
+    The inked columns of each row of a stand-in glyph.
+    """
+    if char.isspace():
+        return ((),) * font.y
+    seed = zlib.crc32(char.encode('utf-8'))
+    rows = []
+    for y in range(font.y):
+        bits = zlib.crc32(y.to_bytes(2, 'big'), seed)
+        rows.append(tuple(x for x in range(font.x) if bits >> x & 1))
+    return tuple(rows)
+
+
+def _number_text(flags: int, whole: int, frac: int, value: int) -> str:
+    """
+    Approximate how the panel lays out a number.
+    """
+    signed = flags & 0x40
+    fill = ('0' if flags & 0x10 else ' ') if flags & 0x20 else ' '
+    sign = '-' if value < 0 else '+'
+    value = abs(value)
+    if frac:
+        ipart, fpart = divmod(value, 10 ** frac)
+        text = str(ipart).rjust(whole, fill)[-whole:] + '.' + str(fpart).zfill(frac)
+    else:
+        text = str(value).rjust(whole, fill)[-whole:]
+    return (sign if signed or sign == '-' else '') + text
+
+
+class _Damage:
+    """
+    Accumulates the bounding box of changed pixels.
+    """
+    __slots__ = 'left', 'top', 'right', 'bottom'
+
+    def __init__(self):
+        self.left = self.top = None
+        self.right = self.bottom = None
+
+    def add(self, left, top, right, bottom):
+        if self.left is None:
+            self.left, self.top, self.right, self.bottom = left, top, right, bottom
+        else:
+            self.left = min(self.left, left)
+            self.top = min(self.top, top)
+            self.right = max(self.right, right)
+            self.bottom = max(self.bottom, bottom)
+
+    def rect(self) -> typing.Union[Rect, None]:
+        if self.left is None:
+            return None
+        return self.left, self.top, self.right, self.bottom
+
+
+class PanelModel:
+    """
+    The panel's pixels, as RGB565, row-major.
+    """
+    width = WIDTH
+    height = HEIGHT
+
+    #: False until something has been drawn over the whole screen; until then
+    #: we don't know what the panel shows and assume every command changes it.
+    valid: bool = False
+
+    brightness: int = 0xFF
+    direction: int = 0
+
+    def __init__(self):
+        self.pixels = array.array('H', bytes(2 * self.width * self.height))
+        #: Where icon animations have been drawn. The panel changes these
+        #: pixels on its own, so we can't say what they are.
+        self.animations: dict[int, Rect] = {}
+        #: Bit mask of running animations
+        self.running: int = 0
+        #: Areas holding stand-in pixels, and the packet that drew all of each
+        #: (None once something else has drawn over part of it). Drawing that
+        #: same packet again is the only thing known to leave them alone.
+        self.stand_ins: dict[Rect, typing.Union[bytes, None]] = {}
+
+    def _forget_stopped(self):
+        """
+        Stopped animations that have been painted over are just pixels again.
+        """
+        for anim_id in list(self.animations):
+            if not self.running & (1 << anim_id):
+                del self.animations[anim_id]
+
+    def invalidate(self):
+        """
+        The panel has been drawn on behind our back.
+        """
+        self.valid = False
+
+    # Pixel operations. Coordinates are clipped; right and bottom are exclusive.
+
+    def _clip(self, left, top, right, bottom):
+        return (
+            max(left, 0), max(top, 0),
+            min(right, self.width), min(bottom, self.height),
+        )
+
+    def _fill(self, damage: _Damage, color: int, left, top, right, bottom):
+        left, top, right, bottom = self._clip(left, top, right, bottom)
+        if left >= right or top >= bottom:
+            return
+        span = array.array('H', [color]) * (right - left)
+        pixels = self.pixels
+        first = last = None
+        for y in range(top, bottom):
+            start = y * self.width + left
+            if pixels[start:start + len(span)] != span:
+                pixels[start:start + len(span)] = span
+                if first is None:
+                    first = y
+                last = y
+        if first is not None:
+            # Not tracking columns exactly; the fill spans them all anyway
+            damage.add(left, first, right, last + 1)
+
+    def _set(self, damage: _Damage, color: int, x: int, y: int):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = y * self.width + x
+            if self.pixels[i] != color:
+                self.pixels[i] = color
+                damage.add(x, y, x + 1, y + 1)
+
+    def _xor(self, damage: _Damage, color: int, left, top, right, bottom):
+        left, top, right, bottom = self._clip(left, top, right, bottom)
+        if not color or left >= right or top >= bottom:
+            return
+        pixels = self.pixels
+        for y in range(top, bottom):
+            row = y * self.width
+            for i in range(row + left, row + right):
+                pixels[i] ^= color
+        damage.add(left, top, right, bottom)
+
+    def _text(self, damage: _Damage, font: Font, x: int, y: int, text: str, fg: int, bg: typing.Union[int, None]):
+        for n, char in enumerate(text):
+            cx = x + n * font.x
+            glyph = _glyph(font, char)
+            if bg is None:
+                for dy, columns in enumerate(glyph):
+                    for dx in columns:
+                        self._set(damage, fg, cx + dx, y + dy)
+                continue
+            # Opaque cells are composed first, so redrawing the same text
+            # doesn't count as a change
+            left, top, right, bottom = self._clip(cx, y, cx + font.x, y + font.y)
+            if left >= right or top >= bottom:
+                continue
+            for py in range(top, bottom):
+                row = array.array('H', [bg]) * font.x
+                for dx in glyph[py - y]:
+                    row[dx] = fg
+                row = row[left - cx:right - cx]
+                start = py * self.width + left
+                if self.pixels[start:start + len(row)] != row:
+                    self.pixels[start:start + len(row)] = row
+                    damage.add(left, py, right, py + 1)
+
+    def _move(self, damage: _Damage, mode: int, direction: int, distance: int, color: int, rect: Rect):
+        left, top, right, bottom = self._clip(*rect)
+        if left >= right or top >= bottom or not distance:
+            return
+        w = self.width
+        rows = [self.pixels[y * w + left:y * w + right] for y in range(top, bottom)]
+        filler = array.array('H', [color]) * (right - left)
+        cycle = mode == MoveMode.CYCLE
+        if direction in (MoveDir.UP, MoveDir.DOWN):
+            distance = min(distance, len(rows))
+            if direction == MoveDir.UP:
+                exposed = rows[:distance] if cycle else [filler] * distance
+                rows = rows[distance:] + exposed
+            else:
+                exposed = rows[-distance:] if cycle else [filler] * distance
+                rows = exposed + rows[:-distance]
+        else:
+            distance = min(distance, right - left)
+            moved = []
+            for row in rows:
+                if direction == MoveDir.LEFT:
+                    exposed = row[:distance] if cycle else filler[:distance]
+                    moved.append(row[distance:] + exposed)
+                else:
+                    exposed = row[-distance:] if cycle else filler[:distance]
+                    moved.append(exposed + row[:-distance])
+            rows = moved
+        for y, row in zip(range(top, bottom), rows):
+            start = y * w + left
+            if self.pixels[start:start + len(row)] != row:
+                self.pixels[start:start + len(row)] = row
+                damage.add(left, y, right, y + 1)
+
+    # Commands
+
+    def apply(self, body: bytes) -> typing.Union[Rect, None]:
+        """
+        Apply a packet body (instruction byte and data) to the model.
+
+        Returns the bounding box of the pixels that changed, or None if none
+        did.
+        """
+        damage = _Damage()
+        cmd = body[0]
+        try:
+            self._apply(damage, cmd, body)
+        except (struct.error, ValueError, IndexError):
+            LOG.debug("Could not model packet %s", body.hex())
+            # We no longer know what's on screen
+            self.valid = False
+            return SCREEN
+        bounds = packet_bounds(body)
+        unsure = self._track_stand_ins(cmd, body, bounds)
+        if not self.valid:
+            if cmd in (Commands.CLEAR_SCREEN, Commands.DRAW_JPEG):
+                self.valid = True
+            return bounds
+        rect = damage.rect()
+        if rect is None and unsure:
+            # The real pixels there may well change
+            return bounds
+        if rect is None and self.animations:
+            if any(overlaps(bounds, area) for area in self.animations.values()):
+                # Might have been drawing over an animation frame
+                return bounds
+        return rect
+
+    def would_change(self, body: bytes) -> bool:
+        """
+        Would applying this packet change any pixels?
+
+        Does not modify the model.
+        """
+        if not self.valid:
+            return packet_bounds(body) is not None
+        saved, saved_stand_ins = self.pixels, self.stand_ins
+        self.pixels = array.array('H', saved)
+        self.stand_ins = dict(saved_stand_ins)
+        try:
+            return self.apply(body) is not None
+        finally:
+            self.pixels, self.stand_ins = saved, saved_stand_ins
+
+    def _track_stand_ins(self, cmd: int, body: bytes, bounds: typing.Union[Rect, None]) -> bool:
+        """
+        Update :attr:`stand_ins` for a packet that has just been applied.
+
+        Returns whether it may have changed pixels we don't know exactly:
+        it's a stand-in, or drew over one, and isn't just the same packet
+        drawn again.
+        """
+        if cmd == Commands.CLEAR_SCREEN:
+            self.stand_ins.clear()
+            return False
+        if bounds is None:
+            return False
+        touched = [area for area in self.stand_ins if overlaps(bounds, area)]
+        redraw = self.stand_ins.get(bounds) == body
+        # Stand-ins themselves aren't the real pixels, so are only known to
+        # change nothing when they're drawn again
+        unsure = any(area != bounds for area in touched) or (bool(touched) or cmd in _STAND_INS) and not redraw
+        if cmd == Commands.DRAW_JPEG:
+            # Covers the whole screen
+            self.stand_ins = {SCREEN: body}
+            return unsure
+        covers = cmd in _STAND_INS or (cmd == Commands.DRAW_RECT and body[1] == RectMode.FILLED)
+        for area in touched:
+            if covers and _contains(bounds, area):
+                del self.stand_ins[area]
+            else:
+                self.stand_ins[area] = None
+        if cmd in _STAND_INS:
+            self.stand_ins[bounds] = body
+        elif cmd == Commands.MOVE_REGION and touched:
+            # Stand-in pixels may have moved anywhere in it
+            self.stand_ins[bounds] = None
+        return unsure
+
+    def _apply(self, damage: _Damage, cmd: int, body: bytes):
+        if cmd == Commands.CLEAR_SCREEN:
+            color, = struct.unpack_from('>H', body, 1)
+            self._fill(damage, color, *SCREEN)
+            self._forget_stopped()
+
+        elif cmd == Commands.DRAW_RECT:
+            mode, color, x0, y0, x1, y1 = struct.unpack_from('>BH2H2H', body, 1)
+            left, top, right, bottom = min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1
+            if mode == RectMode.FILLED:
+                self._fill(damage, color, left, top, right, bottom)
+            elif mode == RectMode.XOR:
+                self._xor(damage, color, left, top, right, bottom)
+            else:
+                self._fill(damage, color, left, top, right, top + 1)
+                self._fill(damage, color, left, bottom - 1, right, bottom)
+                self._fill(damage, color, left, top, left + 1, bottom)
+                self._fill(damage, color, right - 1, top, right, bottom)
+
+        elif cmd == Commands.DRAW_LINE:
+            color, x0, y0, x1, y1 = struct.unpack_from('>H2H2H', body, 1)
+            # Bresenham
+            dx, dy = abs(x1 - x0), -abs(y1 - y0)
+            sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+            err = dx + dy
+            while True:
+                self._set(damage, color, x0, y0)
+                if x0 == x1 and y0 == y1:
+                    break
+                e2 = 2 * err
+                if e2 >= dy:
+                    err += dy
+                    x0 += sx
+                if e2 <= dx:
+                    err += dx
+                    y0 += sy
+
+        elif cmd == Commands.DRAW_POINT:
+            color, w, h = struct.unpack_from('>H2B', body, 1)
+            coords = struct.unpack_from(f'>{(len(body) - 5) // 2}H', body, 5)
+            for x, y in zip(coords[0::2], coords[1::2]):
+                self._fill(damage, color, x, y, x + w, y + h)
+
+        elif cmd == Commands.MOVE_REGION:
+            flags, distance, color, x0, y0, x1, y1 = struct.unpack_from('>BHH2H2H', body, 1)
+            self._move(
+                damage, flags >> 7, flags & 0b11, distance, color,
+                (min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1),
+            )
+
+        elif cmd == Commands.DRAW_TEXT:
+            flags, fg, bg, x, y = struct.unpack_from('>BHH2H', body, 1)
+            self._text(
+                damage, Font(flags & 0b1111), x, y, body[10:].decode('utf-8', errors='replace'),
+                fg, bg if flags & 0x40 else None,
+            )
+
+        elif cmd == Commands.DRAW_NUMBER:
+            flags, fg, bg, whole, frac, x, y, value = struct.unpack_from('>BHHBB2Hq', body, 1)
+            self._text(
+                damage, Font(flags & 0b1111), x, y, _number_text(flags, whole, frac, value),
+                fg, bg if flags & 0x80 else None,
+            )
+
+        elif cmd == Commands.DRAW_ICON:
+            x, y, lib, icon = struct.unpack_from('>2HBB', body, 1)
+            lib &= 0x7F
+            if lib == 9 and icon in imdata.ICONS:
+                info = imdata.ICONS[icon]
+                self._fill(damage, _stand_in('icon', lib, icon), x, y, x + info.width, y + info.height)
+            else:
+                raise ValueError(f"Unknown icon {lib}:{icon}")
+
+        elif cmd == Commands.DRAW_JPEG:
+            _, pic = struct.unpack_from('>BB', body, 1)
+            self._fill(damage, _stand_in('jpeg', pic), *SCREEN)
+            self._forget_stopped()
+
+        elif cmd == Commands.DRAW_ICON_ANIM:
+            _, _, flags = struct.unpack_from('>2HB', body, 1)
+            anim_id = flags & 0x0F
+            area = packet_bounds(body)
+            self.animations[anim_id] = area
+            if flags & 0x80:
+                self.running |= 1 << anim_id
+            else:
+                self.running &= ~(1 << anim_id)
+            damage.add(*area)
+
+        elif cmd == Commands.SET_ANIM:
+            self.running, = struct.unpack_from('>H', body, 1)
+
+        elif cmd == Commands.DRAW_QR_CODE:
+            x, y, size = struct.unpack_from('>2HB', body, 1)
+            left, top, right, bottom = packet_bounds(body)
+            self._fill(damage, 0xFFFF, left, top, right, bottom)
+            self._fill(damage, _stand_in('qr', body[6:]), left + size, top + size, right - size, bottom - size)
+
+        elif cmd == Commands.BACKLIGHT_BRIGHTNESS_ADJUSTMENT:
+            self.brightness = body[1]
+
+        elif cmd == Commands.SET_ROTATION:
+            self.direction = body[4]
+
+        elif cmd in (Commands.COMMIT, Commands.HANDSHAKE):
+            pass
+
+        elif cmd in (Commands.WRITE_DATA_MEMORY, Commands.READ_DATA_MEMORY, Commands.WRITE_PICTURE_MEMORY):
+            # Nothing shown changes until the picture is drawn
+            pass
+
+        else:
+            raise ValueError(f"Unmodeled command {cmd:#04x}")
+
+    def to_rgb888(self) -> bytes:
+        """
+        Get the pixels as packed 8-bit RGB, row-major.
+        """
+        out = bytearray(3 * len(self.pixels))
+        for i, px in enumerate(self.pixels):
+            r, g, b = px >> 11, (px >> 5) & 0b111111, px & 0b11111
+            out[3 * i] = (r << 3) | (r >> 2)
+            out[3 * i + 1] = (g << 2) | (g >> 4)
+            out[3 * i + 2] = (b << 3) | (b >> 2)
+        return bytes(out)
+
+    def to_png(self) -> bytes:
+        """
+        Get the pixels as a PNG image.
+        """
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        rgb = self.to_rgb888()
+        stride = 3 * self.width
+        # Each row is prefixed with its filter type; 0 is none
+        raw = b''.join(b'\x00' + rgb[y * stride:(y + 1) * stride] for y in range(self.height))
+        return b''.join([
+            b'\x89PNG\r\n\x1a\n',
+            chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)),
+            chunk(b'IDAT', zlib.compress(raw)),
+            chunk(b'IEND', b''),
+        ])
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """
+        Apply a stream of framed packets.
+
+        Returns the packet bodies found. Incomplete trailing data is ignored.
+        """
+        bodies = []
+        head, tail = T5UIC1_LCD.PACKET_HEAD, T5UIC1_LCD.PACKET_TAIL
+        for chunk in bytes(data).split(tail)[:-1]:
+            start = chunk.find(head)
+            if start < 0:
+                continue
+            body = chunk[start + len(head):]
+            if body:
+                bodies.append(body)
+                self.apply(body)
+        return bodies
+
+
+class ModelPort:
+    """
+    Enough of a :class:`serial.Serial` to run a
+    :class:`~pintail.systems.dwin_screen.T5UIC1_LCD` against a
+    :class:`PanelModel`, with no hardware.
+
+    Example: ::
+
+        screen = T5UIC1_LCD(ModelPort())
+    """
+    def __init__(self, model: typing.Union[PanelModel, None] = None, *, crc: bool = False):
+        """
+        Args:
+            model: What to draw into
+            crc: Act like firmware 2.3 and later, which checks CRCs once it
+                has seen one
+        """
+        self.model = model if model is not None else PanelModel()
+        self.crc_capable = crc
+        #: Packets are expected to carry a CRC
+        self.crc = False
+        self._inbuf = bytearray()
+        self._outbuf = bytearray()
+        self._cond = threading.Condition()
+        #: Seconds :meth:`read` waits for a reply
+        self.timeout = None
+        #: The panel's data memory
+        self.sram = bytearray(T5UIC1_LCD.SRAM_SIZE)
+        self.flash = bytearray(0x4000)
+        #: Total bytes written, as the panel would have received them
+        self.bytes_written = 0
+        #: Number of COMMITs received
+        self.commits = 0
+        #: Packets dropped for a bad CRC
+        self.crc_errors = 0
+
+    def _check_crc(self, body: bytes) -> typing.Union[bytes, None]:
+        """
+        Strip the CRC off a packet, or return None if it's bad.
+        """
+        if len(body) > 4 and packet_crc(body[:-4]) == int.from_bytes(body[-4:], 'big'):
+            self.crc = True
+            return body[:-4]
+        elif self.crc:
+            self.crc_errors += 1
+            return None
+        return body
+
+    def _reply(self, body: bytes):
+        if self.crc:
+            body += packet_crc(body).to_bytes(4, 'big')
+        with self._cond:
+            self._outbuf += T5UIC1_LCD.PACKET_HEAD + body + T5UIC1_LCD.PACKET_TAIL
+            self._cond.notify_all()
+
+    def _memory(self, body: bytes):
+        cmd = body[0]
+        if cmd == Commands.WRITE_DATA_MEMORY:
+            memtype, address = struct.unpack_from('>BH', body, 1)
+            memory = self.flash if memtype == 0xA5 else self.sram
+            data = body[4:]
+            memory[address:address + len(data)] = data
+            if memtype == 0xA5:
+                self._reply(b"\xA5OK")
+        elif cmd == Commands.READ_DATA_MEMORY:
+            memtype, address, length = struct.unpack_from('>BHB', body, 1)
+            memory = self.flash if memtype == 0xA5 else self.sram
+            self._reply(body[:5] + bytes(memory[address:address + length]))
+        elif cmd == Commands.WRITE_PICTURE_MEMORY:
+            self._reply(b"\xA5OK")
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.bytes_written += len(data)
+        self._inbuf += data
+        head, tail = T5UIC1_LCD.PACKET_HEAD, T5UIC1_LCD.PACKET_TAIL
+        end = self._inbuf.rfind(tail)
+        if end >= 0:
+            end += len(tail)
+            for chunk in bytes(self._inbuf[:end]).split(tail)[:-1]:
+                start = chunk.find(head)
+                body = chunk[start + len(head):] if start >= 0 else b''
+                if self.crc_capable and body:
+                    body = self._check_crc(body)
+                if not body:
+                    continue
+                self.model.apply(body)
+                if body[0] == Commands.HANDSHAKE:
+                    self._reply(b"\x00OK")
+                elif body[0] == Commands.COMMIT:
+                    self.commits += 1
+                elif body[0] in (Commands.WRITE_DATA_MEMORY, Commands.READ_DATA_MEMORY, Commands.WRITE_PICTURE_MEMORY):
+                    self._memory(body)
+            del self._inbuf[:end]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._outbuf)
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Read up to ``size`` bytes of replies, waiting up to :attr:`timeout`
+        for there to be any.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._outbuf, self.timeout)
+            data = bytes(self._outbuf[:size])
+            del self._outbuf[:size]
+            return data
+
+    def read_until(self, expected=b"\n", size=None) -> bytes:
+        with self._cond:
+            end = self._outbuf.find(expected)
+            end = len(self._outbuf) if end < 0 else end + len(expected)
+            data = bytes(self._outbuf[:end])
+            del self._outbuf[:end]
+            return data
+
+    def close(self):
+        pass
@@ -0,0 +1,165 @@
+"""
+Reads replies from the screen on a dedicated thread, and hands each one to
+whoever is waiting for it.
+"""
+import collections
+import concurrent.futures
+import dataclasses
+import logging
+import threading
+import time
+import typing
+
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Pending:
+    """
+    A request waiting for its reply.
+    """
+    #: The instruction byte of the reply
+    reply: int
+    future: concurrent.futures.Future
+    #: :func:`time.monotonic` after which to give up
+    deadline: float
+    #: Turns the reply's data into the future's result
+    parse: typing.Callable[[bytes], typing.Any] = bytes
+    #: Sends the request again, if a damaged reply may have been its answer.
+    #: Cleared once used, so each request is sent again at most once.
+    resend: typing.Optional[typing.Callable[[], typing.Any]] = None
+
+
+class ReplyReader:
+    """
+    Parses packets from the port as they arrive, and resolves the futures of
+    the requests they answer.
+
+    The screen answers in order, so a reply goes to the oldest request
+    expecting that instruction, and a damaged reply was most likely meant for
+    the oldest request of all, which is sent again if it can be. Requests
+    that go unanswered past their deadline fail with :exc:`TimeoutError`.
+    """
+    def __init__(self, read: typing.Callable[[], bytes], unframe: typing.Callable[[bytes], typing.Optional[tuple[int, bytes]]],
+                 tail: bytes, name: str = "dwin-reader"):
+        """
+        Args:
+            read: Reads whatever has arrived, waiting briefly if nothing has
+            unframe: Finds the packet in what arrived up to a tail, and turns
+                it into an instruction byte and data, or None if there's no
+                intact packet
+            tail: End of a packet
+        """
+        self._read = read
+        self._unframe = unframe
+        self._tail = tail
+        self._buf = bytearray()
+        self._pending: collections.deque[Pending] = collections.deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        #: Replies nobody was waiting for
+        self.unexpected = 0
+        #: Requests sent again because of a damaged reply
+        self.resent = 0
+        self._thread = threading.Thread(None, self._read_thread, name=name, daemon=True)
+        self._thread.start()
+
+    def expect(self, reply: int, timeout: float, parse: typing.Callable[[bytes], typing.Any] = bytes,
+               resend: typing.Optional[typing.Callable[[], typing.Any]] = None) -> concurrent.futures.Future:
+        """
+        Register for a reply. Call before sending the request, so the reply
+        can't arrive first.
+
+        Args:
+            reply: The instruction byte of the reply
+            timeout: Seconds to wait for it
+            parse: Turns the reply's data into the future's result
+            resend: Sends the request again; called from the reader thread,
+                at most once, if a damaged reply arrives while it's the
+                oldest request waiting
+        """
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Reader is closed")
+            self._pending.append(Pending(reply, future, time.monotonic() + timeout, parse, resend))
+        return future
+
+    def close(self, timeout: typing.Optional[float] = None):
+        """
+        Stop the thread, failing everything still waiting.
+        """
+        self._closed = True
+        self._thread.join(timeout)
+        with self._lock:
+            pending, self._pending = self._pending, collections.deque()
+        for p in pending:
+            p.future.set_exception(RuntimeError("Reader closed"))
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [p for p in self._pending if p.deadline < now]
+            for p in expired:
+                self._pending.remove(p)
+        for p in expired:
+            p.future.set_exception(TimeoutError(f"No reply {p.reply:#04x} from screen"))
+
+    def _dispatch(self, cmd: int, data: bytes):
+        with self._lock:
+            for p in self._pending:
+                if p.reply == cmd:
+                    self._pending.remove(p)
+                    break
+            else:
+                p = None
+        if p is None:
+            self.unexpected += 1
+            LOG.debug("Unexpected reply from screen: %#04x %r", cmd, data)
+            return
+        try:
+            p.future.set_result(p.parse(data))
+        except Exception as exc:
+            p.future.set_exception(exc)
+
+    def _damaged(self):
+        with self._lock:
+            if not self._pending:
+                return
+            oldest = self._pending[0]
+            resend, oldest.resend = oldest.resend, None
+        if resend is None:
+            return
+        self.resent += 1
+        LOG.debug("Damaged reply from screen; asking for %#04x again", oldest.reply)
+        try:
+            resend()
+        except Exception:
+            LOG.exception("Error sending request again")
+
+    def _feed(self, data: bytes):
+        self._buf += data
+        while (end := self._buf.find(self._tail)) >= 0:
+            packet = bytes(self._buf[:end])
+            del self._buf[:end + len(self._tail)]
+            reply = self._unframe(packet)
+            if reply is not None:
+                self._dispatch(*reply)
+            else:
+                self._damaged()
+
+    def _read_thread(self):
+        while not self._closed:
+            try:
+                data = self._read()
+            except Exception:
+                if self._closed:
+                    return
+                LOG.exception("Error reading from screen")
+                time.sleep(0.1)
+                continue
+            if data:
+                self._feed(data)
+            self._expire()
@@ -1,6 +1,7 @@
 """
 https://github.com/ihrapsa/T5UIC1-DWIN-toolset/
 """
+import concurrent.futures
 import enum
 import functools
 import time
@@ -9,10 +10,16 @@ import math
 import re
 import serial
 import struct
+import threading
+import typing
+import zlib
 from typing import overload, Union
 
 import ppb
+from ppb import Vector
 
+from .dwin_writer import FrameWriter
+from .dwin_reader import ReplyReader
 
 LOG = logging.getLogger(__name__)
 
@@ -39,8 +46,133 @@ def RGB(*args):
     return (r << 11) | (g << 5) | b
 
 
+class _PacketStruct(struct.Struct):
+    #: Packs just the body (instruction byte and data), for recording
+    body: struct.Struct
+
+
+@functools.lru_cache(maxsize=256)
+def _encoder(fmt: str) -> _PacketStruct:
+    """
+    Get the compiled packer for a whole packet (head, instruction byte, data,
+    tail) of the given shape.
+    """
+    encoder = _PacketStruct('>1sB' + fmt + '4s')
+    encoder.body = struct.Struct('>B' + fmt)
+    return encoder
+
+
+@functools.lru_cache(maxsize=512)
+def _framing(length: int, crc: bool) -> struct.Struct:
+    """
+    Get the packer that frames a packet body of the given length.
+    """
+    return struct.Struct(f'>1s{length}sI4s' if crc else f'>1s{length}s4s')
+
+
+# The fixed-shape packets, compiled up front
+_CLEAR_PACKET = _encoder('H')
+_LINE_PACKET = _encoder('H2H2H')
+_RECT_PACKET = _encoder('BH2H2H')
+_NUMBER_PACKET = _encoder('BHHBB2Hq')
+_ICON_PACKET = _encoder('2HBB')
+
+
+#: The CRC32 and tail, for packets framed with a CRC
+_CRC_TAIL = struct.Struct('>I4s')
+
+
+#: Instruction byte of the acknowledgement of a flash write
+FLASH_ACK = 0xA5
+
+_MEMORY_REPLY = struct.Struct('>BHB')
+
+
+def _check_ack(data: bytes) -> None:
+    if data != b"OK":
+        raise ValueError(f"Bad acknowledgement from screen: {data!r}")
+
+
+def _reply_intact(cmd: int, data: bytes) -> bool:
+    """
+    Whether a reply's data is the length it should be, for the replies whose
+    length we know.
+    """
+    if cmd in (Commands.HANDSHAKE, FLASH_ACK):
+        return len(data) == 2
+    if cmd == Commands.READ_DATA_MEMORY:
+        return len(data) >= _MEMORY_REPLY.size and len(data) == _MEMORY_REPLY.size + data[_MEMORY_REPLY.size - 1]
+    return True
+
+
+def _parse_memory(data: bytes) -> bytes:
+    # Type, address, length, data
+    _, _, length = _MEMORY_REPLY.unpack_from(data)
+    body = data[_MEMORY_REPLY.size:]
+    if len(body) != length:
+        raise ValueError(f"Expected {length} bytes of memory, got {len(body)}")
+    return body
+
+
+def packet_crc(body: bytes) -> int:
+    """
+    The CRC32 of a packet body (instruction byte and data), as sent on the
+    wire by firmware 2.3 and later.
+    """
+    return zlib.crc32(body)
+
+
+@functools.lru_cache(maxsize=256)
+def _text_encoder(length: int) -> _PacketStruct:
+    """
+    Get the packer for :attr:`Commands.DRAW_TEXT` with this many bytes of text.
+    """
+    return _encoder(f'BHH2H{length}s')
+
+
+_NUMBER_FORMAT = re.compile(r"^(?P<prefix>[+])?(?P<fill>[ 0])?(?P<digits>\d+)(?:\.(?P<precision>\d+))?$")
+
+
+@functools.lru_cache(maxsize=64)
+def _number_format(fmt: str) -> tuple[int, int, int]:
+    """
+    Parse a :meth:`T5UIC1_LCD.draw_number` format.
+
+    Returns the format bits of the flags byte, the number of whole digits, and
+    the number of fractional digits.
+    """
+    fmtmatch = _NUMBER_FORMAT.match(fmt)
+    if fmtmatch is None:
+        raise ValueError(f"Bad number format: {fmt!r}")
+    fparams = fmtmatch.groupdict()
+
+    signed = fparams['prefix'] == '+'
+
+    if fparams['fill'] == None:
+        dofill = False
+        fillmode = 0
+    elif fparams['fill'] == '0':
+        dofill = True
+        fillmode = 1
+    else:
+        dofill = True
+        fillmode = 0
+
+    wholedigits, trailingdigits = int(fparams['digits'] or 1), int(fparams['precision'] or 0)
+    return (signed << 6) | (dofill << 5) | (fillmode << 4), wholedigits, trailingdigits
+
+
+def number_length(fmt: str, value: Union[int, float]) -> int:
+    """
+    How many characters :meth:`T5UIC1_LCD.draw_number` takes to show a value.
+    """
+    fmtbits, wholedigits, trailingdigits = _number_format(fmt)
+    signed = fmtbits & 0x40 or round(value * 10 ** trailingdigits) < 0
+    return bool(signed) + wholedigits + (trailingdigits + 1 if trailingdigits else 0)
+
+
 def _p(pos):
-    if isinstance(pos, ppb.Vector):
+    if isinstance(pos, Vector):
         # Do axis conversion
         x, y = pos
         y = 480 - y
@@ -49,6 +181,12 @@ def _p(pos):
     return int(x), int(y)
 
 
+class HandshakeError(Exception):
+    """
+    Raised when there's no screen answering on a port
+    """
+
+
 class Commands(enum.IntEnum):
     #: ping/pong
     HANDSHAKE = 0x00
@@ -82,6 +220,32 @@ class Commands(enum.IntEnum):
     DRAW_ICON_ANIM = 0x28
     SET_ANIM = 0x29
 
+    #: Show everything drawn since the last commit
+    COMMIT = 0x3D
+
+
+#: Commands that only change pixels. Frames consisting solely of these can be
+#: dropped if a later frame repaints the whole screen.
+_DRAW_COMMANDS = frozenset(map(int, {
+    Commands.CLEAR_SCREEN,
+    Commands.DRAW_POINT,
+    Commands.DRAW_LINE,
+    Commands.DRAW_RECT,
+    Commands.MOVE_REGION,
+    Commands.DRAW_TEXT,
+    Commands.DRAW_NUMBER,
+    Commands.DRAW_QR_CODE,
+    Commands.DRAW_JPEG,
+    Commands.DRAW_ICON,
+    Commands.COMMIT,
+}))
+
+#: Commands that paint over the whole screen; draw_jpeg always shows a
+#: fullscreen picture
+_FULL_SCREEN_COMMANDS = frozenset(map(int, {
+    Commands.CLEAR_SCREEN,
+    Commands.DRAW_JPEG,
+}))
 
 
 class RectMode(enum.IntEnum):
@@ -89,6 +253,22 @@ class RectMode(enum.IntEnum):
     FILLED = 1
     XOR = 2
 
+
+class MoveMode(enum.IntEnum):
+    #: What moves off one edge comes back on the other
+    CYCLE = 0
+    #: The exposed area is filled with a color
+    TRANSLATE = 1
+
+
+class MoveDir(enum.IntEnum):
+    LEFT = 0
+    RIGHT = 1
+    #: Towards the top of the screen
+    UP = 2
+    #: Towards the bottom of the screen
+    DOWN = 3
+
 _font_dimensions = {
     0: (6,12),
     1: (8,16),
@@ -148,23 +328,137 @@ class T5UIC1_LCD:
     height = 480
 
     RectMode = RectMode
+    MoveMode = MoveMode
+    MoveDir = MoveDir
     Font = Font
     RGB = staticmethod(RGB)
 
-    def __init__(self, usart: str, exclusive=True):
+    #: Size of the preallocated frame buffer. A frame that outgrows it is
+    #: written out in several pieces, but still drained only once.
+    frame_size = 4096
+
+    #: True while commands are being collected for a single write on
+    #: :meth:`commit`. See :meth:`begin_frame`.
+    batching: bool = False
+
+    _writer: Union[FrameWriter, None] = None
+    _reader: Union[ReplyReader, None] = None
+
+    #: If set, packet bodies are handed to ``recorder.record()`` instead of
+    #: being sent. See :class:`~pintail.systems.display_list.DisplayList`.
+    recorder = None
+
+    #: If set, told about every write to the port. See
+    #: :class:`~pintail.systems.link_stats.LinkStats`.
+    stats = None
+
+    #: Packets carry a CRC32 before the tail, which the screen checks. Needs
+    #: firmware 2.3 or later; see :meth:`detect_crc`.
+    crc: bool = False
+
+    #: Replies that arrived damaged or weren't what was expected
+    bad_replies: int = 0
+
+    #: Ports the screen may be on, for :meth:`find`
+    CANDIDATE_PORTS = ("/dev/ttyAMA0", "/dev/ttyAMA1", "/dev/ttyS0")
+
+    #: Handshakes to try before giving up on a port. With the backoff below,
+    #: that's about 8 seconds, long enough for a panel that's still booting.
+    handshake_attempts = 12
+    #: Seconds to wait for the first handshake to be answered
+    handshake_timeout = 0.1
+    #: Each unanswered handshake waits this much longer than the last...
+    handshake_backoff = 1.5
+    #: ...up to this many seconds
+    handshake_max_timeout = 1.0
+
+    def __init__(self, usart: Union[str, serial.Serial], exclusive=True, *, crc: Union[bool, None] = None):
         """
         Args:
-            usart: serial port to connect to
+            usart: serial port to connect to, or an already-open port (such as
+                a :class:`~pintail.systems.dwin_model.ModelPort`)
+            crc: Whether to use CRC framing; None to use it if the screen
+                supports it
+
+        Raises:
+            HandshakeError: The screen didn't answer
         """
-        self.port = serial.Serial(usart, 115200, timeout=1, exclusive=exclusive)
+        self._frame = bytearray(self.frame_size)
+        self._frame_len = 0
+        self._frame_full = False
+        self._frame_replaceable = True
+        # Requests can be sent again from the reader thread
+        self._port_lock = threading.Lock()
+        start = time.perf_counter()
+        if isinstance(usart, str):
+            self.port = serial.Serial(usart, 115200, timeout=1, exclusive=exclusive)
+        else:
+            self.port = usart
         LOG.debug("Port opened")
-        while not self.handshake():
-            pass
-        LOG.info("Screen handshake completed")
+        timeout = self.handshake_timeout
+        for attempt in range(self.handshake_attempts):
+            if self.handshake(timeout=timeout):
+                break
+            timeout = min(timeout * self.handshake_backoff, self.handshake_max_timeout)
+        else:
+            self.port.close()
+            raise HandshakeError(f"No screen answered on {getattr(self.port, 'port', self.port)}")
+        if crc is None:
+            crc = self.detect_crc()
+        self.crc = crc
+        LOG.info(
+            "Screen handshake completed in %.0fms (%d attempts), CRC %s",
+            (time.perf_counter() - start) * 1000, attempt + 1, "on" if self.crc else "off",
+        )
         # self.JPG_ShowAndCache(0)
         self.set_direction(1)
         self.commit()
 
+    @classmethod
+    def find(cls, ports: typing.Iterable[str] = CANDIDATE_PORTS, **kwargs) -> 'T5UIC1_LCD':
+        """
+        Try several ports at once, and connect to whichever has a screen.
+
+        Only list ports that may be written to; every port is sent handshakes.
+
+        Raises:
+            HandshakeError: No port had a screen
+        """
+        ports = list(ports)
+        start = time.perf_counter()
+
+        def attempt(port):
+            try:
+                return cls(port, **kwargs)
+            except (HandshakeError, serial.SerialException) as exc:
+                LOG.debug("No screen on %s after %.0fms: %s", port, (time.perf_counter() - start) * 1000, exc)
+                return None
+
+        found = None
+
+        def discard(future):
+            # Another port answered first
+            screen = future.result()
+            if screen is not None and screen is not found:
+                screen.close()
+
+        pool = concurrent.futures.ThreadPoolExecutor(len(ports) or 1, thread_name_prefix="dwin-probe")
+        futures = [pool.submit(attempt, port) for port in ports]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                found = future.result()
+                if found is not None:
+                    LOG.info("Found screen on %s in %.0fms", found.port.port, (time.perf_counter() - start) * 1000)
+                    break
+        finally:
+            # Don't wait for the stragglers to time out
+            for future in futures:
+                future.add_done_callback(discard)
+            pool.shutdown(wait=False)
+        if found is None:
+            raise HandshakeError(f"No screen answered on any of {', '.join(ports)}")
+        return found
+
     def _send(self, cmd: int, fmt:str, *fields, flush: bool=True):
         """
         Send a command
@@ -173,21 +467,175 @@ class T5UIC1_LCD:
             cmd: the instruction byte
             fmt: the format for the rest of the data (in struct form)
             fields: arguments to pack into the data
+            flush: When not batching, write out immediately
+        """
+        self._send_packed(_encoder(fmt), cmd, *fields, flush=flush)
+
+    def _send_packed(self, encoder: struct.Struct, cmd: int, *fields, flush: bool=True):
+        """
+        As :meth:`_send`, with an encoder from :func:`_encoder`.
         """
-        buff = bytearray(self.PACKET_HEAD)
+        head, tail = self.PACKET_HEAD, self.PACKET_TAIL
+        size = encoder.size
+        if self.crc:
+            size += _CRC_TAIL.size - len(tail)
         try:
-            buff += struct.pack('>B'+fmt, cmd, *fields)
+            if self.recorder is not None:
+                self.recorder.record(encoder.body.pack(cmd, *fields))
+                return
+            start = self._frame_len
+            if start + size > len(self._frame):
+                start = self._make_room(size)
+            # Packed straight into the frame buffer, framing and all
+            encoder.pack_into(self._frame, start, head, cmd, *fields, tail)
         except struct.error as exc:
-            print(f"{'>B'+fmt} {[cmd, *fields]!r}")
+            print(f"{encoder.format} {[cmd, *fields]!r}")
             raise
-        # Optional CRC32 goes here, if firmware >=v2.3
-        buff += self.PACKET_TAIL
-        self.port.write(buff)
-        if flush:
-            self._flush()
+        if self.crc:
+            # Squeeze the CRC in before the tail
+            end = start + size - _CRC_TAIL.size
+            with memoryview(self._frame) as view:
+                crc = zlib.crc32(view[start + len(head):end])
+            _CRC_TAIL.pack_into(self._frame, end, crc, tail)
+        self._frame_len = start + size
+        if cmd in _FULL_SCREEN_COMMANDS:
+            self._frame_full = True
+        elif cmd not in _DRAW_COMMANDS:
+            self._frame_replaceable = False
+        if flush and not self.batching:
+            self._write_frame()
         # This was in the original implementation; not sure why
         #time.sleep(0.001)
 
+    def send_raw(self, body: bytes, *, flush: bool=True):
+        """
+        Send an already-encoded packet body (instruction byte and data).
+
+        Follows the same batching and recording rules as every other command.
+        """
+        if self.recorder is not None:
+            self.recorder.record(body)
+            return
+        framing = _framing(len(body), self.crc)
+        start = self._frame_len
+        if start + framing.size > len(self._frame):
+            start = self._make_room(framing.size)
+        # Framed in place, without building the packet first
+        if self.crc:
+            framing.pack_into(self._frame, start, self.PACKET_HEAD, body, packet_crc(body), self.PACKET_TAIL)
+        else:
+            framing.pack_into(self._frame, start, self.PACKET_HEAD, body, self.PACKET_TAIL)
+        self._frame_len = start + framing.size
+        if body[0] in _FULL_SCREEN_COMMANDS:
+            self._frame_full = True
+        elif body[0] not in _DRAW_COMMANDS:
+            self._frame_replaceable = False
+        if flush and not self.batching:
+            self._write_frame()
+
+    def _resend(self, body: bytes):
+        """
+        Send a packet body again from the reader thread, around the frame
+        buffer, which belongs to whoever is drawing.
+        """
+        framing = _framing(len(body), self.crc)
+        if self.crc:
+            packet = framing.pack(self.PACKET_HEAD, body, packet_crc(body), self.PACKET_TAIL)
+        else:
+            packet = framing.pack(self.PACKET_HEAD, body, self.PACKET_TAIL)
+        if self._writer is not None:
+            self._writer.submit(packet, replaceable=False)
+        else:
+            with self._port_lock:
+                self.port.write(packet)
+
+    def _make_room(self, size: int) -> int:
+        """
+        Make room in the frame buffer for a packet of the given size.
+
+        Returns where the packet goes.
+
+        Packets are never reordered: everything goes through the one buffer,
+        in the order it was issued.
+        """
+        if self._writer is None:
+            # Make room by sending what we have; the drain still waits for
+            # the end of the frame.
+            self._write_frame(drain=False)
+        if self._frame_len + size > len(self._frame):
+            # The writer thread takes whole frames, so grow instead
+            self._frame.extend(bytes(max(size, len(self._frame))))
+        return self._frame_len
+
+    def _write_frame(self, drain: bool = True):
+        """
+        Write out the frame buffer in one go, and optionally wait for it to
+        leave the UART.
+
+        If the writer thread is running, the frame is handed to it instead and
+        this never blocks.
+        """
+        if self._writer is not None:
+            if self._frame_len:
+                with memoryview(self._frame) as view:
+                    self._writer.submit(
+                        view[:self._frame_len],
+                        full=self._frame_full, replaceable=self._frame_replaceable,
+                    )
+        else:
+            t0 = time.perf_counter()
+            if self._frame_len:
+                with memoryview(self._frame) as view, self._port_lock:
+                    self.port.write(view[:self._frame_len])
+            t1 = time.perf_counter()
+            if drain:
+                self._flush()
+            if self.stats is not None:
+                self.stats.add_write(self._frame_len, t1 - t0, time.perf_counter() - t1)
+        self._frame_len = 0
+        self._frame_full = False
+        self._frame_replaceable = True
+
+    def start_writer(self, maxsize: int = 4):
+        """
+        Move writing to a background thread.
+
+        Afterwards, sending a frame never blocks the caller. Use
+        :meth:`wait_sent` to wait for frames to reach the screen.
+
+        Args:
+            maxsize: Number of frames that may wait to be written
+        """
+        if self._writer is None:
+            self._write_frame()
+            self._writer = FrameWriter(self.port.write, self._flush, maxsize=maxsize, report=self._report_write)
+
+    def _report_write(self, size: int, write_time: float, drain_time: float):
+        if self.stats is not None:
+            self.stats.add_write(size, write_time, drain_time)
+
+    def wait_sent(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Wait for every committed frame to be written to the screen.
+
+        Returns False if the timeout expired first.
+        """
+        if self._writer is None:
+            return True
+        return self._writer.wait(timeout)
+
+    def close(self):
+        """
+        Finish sending and close the port.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self.port.close()
+
     def _flush(self):
         # Work around for https://github.com/pyserial/pyserial/issues/785
         import errno
@@ -203,22 +651,191 @@ class T5UIC1_LCD:
             else:
                 return
 
-    def _read_one(self) -> tuple[int, bytes]:
+    def _unframe(self, received: bytes) -> Union[tuple[int, bytes], None]:
+        """
+        Find the packet in what was received up to a tail, and split it into
+        instruction and data.
+
+        What was received may start with the end of a packet we came in
+        partway through, and the data may contain the head byte, so each
+        head is tried from the first until one starts an intact packet: one
+        with the right CRC, if we're using them, and the right length, for
+        replies we know.
+        """
+        head = self.PACKET_HEAD
+        start = received.find(head)
+        while start >= 0:
+            packet = received[start + len(head):]
+            if self.crc:
+                body, crc = packet[:-4], int.from_bytes(packet[-4:], 'big')
+                # Too short to carry a CRC is truncated, too
+                if len(packet) > 4 and packet_crc(body) == crc:
+                    packet = body
+                else:
+                    packet = b''
+            if packet and _reply_intact(packet[0], packet[1:]):
+                return packet[0], packet[1:]
+            start = received.find(head, start + 1)
+        LOG.debug("Garbage from screen: %r", received)
+        self.bad_replies += 1
+        return None
+
+    def _read_one(self, timeout: Union[float, None] = None) -> Union[tuple[int, bytes], None]:
         """
         Read a single packet from the serial port
+
+        Returns None if no complete packet arrived before the timeout (by
+        default, the port's).
         """
-        packet = self.port.read_until(self.PACKET_TAIL)
-        assert packet.startswith(self.PACKET_HEAD)
-        packet = packet.removeprefix(self.PACKET_HEAD).removesuffix(self.PACKET_TAIL)
-        return packet[0], packet[1:]
+        if self._reader is not None:
+            raise RuntimeError("The reader thread owns the port; use request()")
+        # Anything still buffered has to go out before we wait on a reply
+        self._write_frame()
+        self.wait_sent()
+        if timeout is not None and isinstance(self.port, serial.Serial):
+            prev, self.port.timeout = self.port.timeout, timeout
+            try:
+                packet = self.port.read_until(self.PACKET_TAIL)
+            finally:
+                self.port.timeout = prev
+        else:
+            packet = self.port.read_until(self.PACKET_TAIL)
+        if not packet.endswith(self.PACKET_TAIL):
+            LOG.debug("Timed out reading from screen; got %r", packet)
+            return None
+        return self._unframe(packet[:-len(self.PACKET_TAIL)])
+
+    def start_reader(self, poll: float = 0.05):
+        """
+        Move reading to a background thread.
+
+        Afterwards, :meth:`request` returns immediately, and replies can be
+        waited for while other commands are sent.
+
+        Args:
+            poll: Longest the thread waits on the port at a time, which is how
+                late a timeout can be noticed
+        """
+        if self._reader is None:
+            self._write_frame()
+            self.wait_sent()
+            self.port.timeout = poll
+            self._reader = ReplyReader(
+                lambda: self.port.read(max(1, self.port.in_waiting)), self._unframe, self.PACKET_TAIL,
+            )
+
+    def request(self, cmd: int, fmt: str, *fields, reply: Union[int, None] = None, timeout: float = 1.0,
+                parse: typing.Callable[[bytes], typing.Any] = bytes) -> concurrent.futures.Future:
+        """
+        Send a command that the screen answers.
+
+        With the reader thread running, this doesn't wait for the answer, and
+        the timeout starts now even if the request is held for the end of the
+        frame. Otherwise, it waits.
+
+        Args:
+            cmd: the instruction byte
+            fmt: the format for the rest of the data (in struct form)
+            fields: arguments to pack into the data
+            reply: the instruction byte of the answer, if not ``cmd``
+            timeout: seconds to wait for the answer
+            parse: turns the answer's data into the result
+
+        Returns:
+            A future of the parsed answer; fails with :exc:`TimeoutError` if
+            none came.
 
-    def handshake(self):
+        If a damaged reply arrives while this is waiting, the request is sent
+        once more, so it must be safe to repeat.
+        """
+        if self.recorder is not None:
+            raise RuntimeError("Can't make requests while recording")
+        if reply is None:
+            reply = cmd
+        body = _encoder(fmt).body.pack(cmd, *fields)
+        if self._reader is not None:
+            # While batching, this goes out with the rest of the frame
+            future = self._reader.expect(reply, timeout, parse, resend=functools.partial(self._resend, body))
+            self.send_raw(body)
+            return future
+
+        future = concurrent.futures.Future()
+        self.send_raw(body)
+        resent = False
+        deadline = time.monotonic() + timeout
+        while (left := deadline - time.monotonic()) > 0:
+            damaged = self.bad_replies
+            answer = self._read_one(left)
+            if answer is not None and answer[0] == reply:
+                try:
+                    future.set_result(parse(answer[1]))
+                except Exception as exc:
+                    future.set_exception(exc)
+                return future
+            if self.bad_replies != damaged and not resent:
+                # Most likely our answer, damaged; ask once more
+                LOG.debug("Damaged reply from screen; asking for %#04x again", reply)
+                resent = True
+                self.send_raw(body)
+        future.set_exception(TimeoutError(f"No reply {reply:#04x} from screen"))
+        return future
+
+    def handshake(self, timeout: Union[float, None] = None) -> bool:
         """
         Send an noop and wait for an acknowledgement
+
+        Args:
+            timeout: Seconds to wait, or None for the port's timeout
         """
+        if self._reader is not None:
+            try:
+                answer = self.request(Commands.HANDSHAKE, '', timeout=timeout or 1.0).result()
+            except TimeoutError:
+                return False
+            if answer != b"OK":
+                self.bad_replies += 1
+                return False
+            return True
+
+        if timeout is not None and isinstance(self.port, serial.Serial):
+            # Don't mistake leftovers for the answer
+            self.port.reset_input_buffer()
         self._send(Commands.HANDSHAKE, '')
-        recv_cmd, recv_data = self._read_one()
-        return recv_cmd == 0x00 and recv_data == b"OK"
+        reply = self._read_one(timeout)
+        if reply is None:
+            return False
+        elif reply != (Commands.HANDSHAKE, b"OK"):
+            self.bad_replies += 1
+            return False
+        return True
+
+    def detect_crc(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Check whether the screen checks CRCs (firmware 2.3 and later).
+
+        Older firmware ignores the CRC as extra data, and answers a handshake
+        whether it's right or not. Firmware that checks it only answers the
+        right one.
+
+        Does not change :attr:`crc`.
+        """
+        if timeout is None:
+            timeout = self.handshake_timeout
+        prev = self.crc
+        try:
+            self.crc = True
+            if not self.handshake(timeout):
+                return False
+            # Deliberately wrong
+            self.crc = False
+            self.send_raw(bytes([Commands.HANDSHAKE]) + (packet_crc(bytes([Commands.HANDSHAKE])) ^ 0xFFFFFFFF).to_bytes(4, 'big'))
+            if self._read_one(timeout) is not None:
+                return False
+            # Make sure it's still listening
+            self.crc = True
+            return self.handshake(timeout)
+        finally:
+            self.crc = prev
 
     def set_brightness(self, value: int):
         """
@@ -243,13 +860,31 @@ class T5UIC1_LCD:
         # TODO: What are these magic numbers?
         self._send(Commands.SET_ROTATION, 'BBBB', 0x34, 0x5A, 0xA5, dir)
 
+    def begin_frame(self):
+        """
+        Start batching commands.
+
+        Until the next :meth:`commit`, commands are collected into the frame
+        buffer instead of being written one at a time. The whole frame then
+        goes out in a single write with a single drain.
+
+        Commands that do not require :meth:`commit` (:meth:`draw_text`,
+        :meth:`draw_number`) are held too; they are transmitted in the order
+        they were issued relative to everything else in the frame.
+        """
+        self.batching = True
+
     def commit(self):
         """
         Update display.
 
         Must be called after all draw operations and most config changes.
+
+        Also ends a batch started by :meth:`begin_frame`, sending it.
         """
-        self._send(0x3D, '')
+        self._send(Commands.COMMIT, '', flush=False)
+        self.batching = False
+        self._write_frame()
 
     def clear_screen(self, color: int):
         """
@@ -258,7 +893,7 @@ class T5UIC1_LCD:
         Args:
             color: Use :func:`RGB`
         """
-        self._send(Commands.CLEAR_SCREEN, 'H', color)
+        self._send_packed(_CLEAR_PACKET, Commands.CLEAR_SCREEN, color)
 
     def draw_points(self, color: int, *pos: tuple[int, int], size: tuple[int, int]=(0x01, 0x01)):
         """
@@ -282,7 +917,7 @@ class T5UIC1_LCD:
             start: x,y of starting point
             end: x,y of ending point
         """
-        self._send(Commands.DRAW_LINE, 'H2H2H', color, *_p(start), *_p(end))
+        self._send_packed(_LINE_PACKET, Commands.DRAW_LINE, color, *_p(start), *_p(end))
 
     def draw_rect(self, mode:RectMode, color: int, start: tuple[int, int], end: tuple[int, int]):
         """
@@ -296,24 +931,29 @@ class T5UIC1_LCD:
             start: x,y of starting point
             end: x,y of ending point    
         """
-        self._send(Commands.DRAW_RECT, 'BH2H2H', mode, color, *_p(start), *_p(end))        
+        self._send_packed(_RECT_PACKET, Commands.DRAW_RECT, mode, color, *_p(start), *_p(end))        
 
-    # Can't confirm
-    def move_area(self, mode:int, dir:int, distance:int, color:int, start:tuple[int,int], end:tuple[int,int]):
+    def move_area(self, mode:MoveMode, dir:MoveDir, distance:int, color:int, start:tuple[int,int], end:tuple[int,int]):
         """
-        Move a portion of the screen.
+        Move a portion of the screen. Requires :meth:`commit`.
 
-        FIXME: Not working.
+        Matches Marlin's ``DWIN_Frame_AreaMove``, which scrolls its menus with
+        ``MoveMode.TRANSLATE`` and ``MoveDir.UP``/``MoveDir.DOWN``.
 
         Args:
-            mode: 0="cycle movement", 1=translate & fill
-            dir: 0=left, 1=right, 2=up, 3=down
+            mode: Whether the exposed area wraps around or is filled
+            dir: Which way the contents move
             distance: number of pixels to move in that direction
-            color: filling color when mode=1
+            color: filling color for ``MoveMode.TRANSLATE``
             start: x,y of one corner of rectangle
             end: x,y of the other corner
         """
-        self._send(Commands.MOVE_REGION, 'BHH2H2H', (mode << 7) | dir, distance, color, *_p(start), *_p(end))
+        # The panel wants the upper-left corner first
+        (x0, y0), (x1, y1) = _p(start), _p(end)
+        self._send(
+            Commands.MOVE_REGION, 'BHH2H2H', (mode << 7) | dir, distance, color,
+            min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1),
+        )
 
     def draw_text(self, pos:tuple[int,int], font:Font, text:str, *, fg_color:int, bg_color: Union[int,None], monospace:bool):
         """
@@ -330,8 +970,8 @@ class T5UIC1_LCD:
             monospace: True if monospace, False if proportional
         """
         btext = text.encode('utf-8')
-        self._send(
-            Commands.DRAW_TEXT, f'BHH2H{len(btext)}s', 
+        self._send_packed(
+            _text_encoder(len(btext)), Commands.DRAW_TEXT,
             (monospace << 7) | ((bg_color is not None) << 6) | (font & 0b1111),
             fg_color,
             bg_color or 0,
@@ -339,8 +979,6 @@ class T5UIC1_LCD:
             btext,
         )
 
-    __number_format = re.compile(r"^(?P<prefix>[+])?(?P<fill>[ 0])?(?P<digits>\d+)(?:\.(?P<precision>\d+))?$")
-
     def draw_number(self, pos:tuple[int,int], font:Font, fmt:str, value:Union[int,float], *, fg_color:int, bg_color:Union[int,None]):
         """
         Draw a number.
@@ -364,36 +1002,13 @@ class T5UIC1_LCD:
 
         Note: ``+`` does not seem to do anything. `` `` seems to be treated as ``0``.
         """
-        fmtmatch = self.__number_format.match(fmt)
-        assert fmtmatch is not None
-        fparams = fmtmatch.groupdict()
-
-        if fparams['prefix'] == None:
-            signed = False
-        elif fparams['prefix'] == '+':
-            signed = True
-        else:
-            raise ValueError
-
-        if fparams['fill'] == None:
-            dofill = False
-            fillmode = 0
-        elif fparams['fill'] == '0':
-            dofill = True
-            fillmode = 1
-        elif fparams['fill'] == ' ':
-            dofill = True
-            fillmode = 0
-        else:
-            raise ValueError
-
-        wholedigits, trailingdigits = int(fparams['digits'] or 1), int(fparams['precision'] or 0)
+        fmtbits, wholedigits, trailingdigits = _number_format(fmt)
 
         inum = round(value * 10 ** trailingdigits)
 
-        self._send(
-            Commands.DRAW_NUMBER, "BHHBB2Hq",
-            (bool(bg_color is not None) << 7) | (signed << 6) | (dofill << 5) | (fillmode << 4) | (int(font) & 0b1111),
+        self._send_packed(
+            _NUMBER_PACKET, Commands.DRAW_NUMBER,
+            ((bg_color is not None) << 7) | fmtbits | (int(font) & 0b1111),
             fg_color,
             bg_color or 0,
             wholedigits,
@@ -427,7 +1042,7 @@ class T5UIC1_LCD:
 
         NOTE: Only library 9 seems to be present 
         """
-        self._send(Commands.DRAW_ICON, '2HBB', *_p(pos), 0x80 | lib_id, icon_id)
+        self._send_packed(_ICON_PACKET, Commands.DRAW_ICON, *_p(pos), 0x80 | lib_id, icon_id)
 
     def draw_qr(self, pos:tuple[int,int], size:int, data:bytes):
         """
@@ -442,6 +1057,136 @@ class T5UIC1_LCD:
         assert len(data) <= 154
         self._send(Commands.DRAW_QR_CODE, f"2HB{len(data)}s", *_p(pos), size, data)
 
+    def copy_area(self, cache_id:int, start:tuple[int,int], end:tuple[int,int], dest:tuple[int,int]):
+        """
+        Copy part of a virtual display area to the screen. Requires :meth:`commit`.
+
+        Args:
+            cache_id: The virtual display area to copy from
+            start: x,y of the upper-left of the area to copy
+            end: x,y of the lower-right of the area to copy
+            dest: x,y on screen to paste the upper-left corner at
+        """
+        self._send(Commands.DRAW_BUFFER2, 'B2H2H2H', 0x80 | cache_id, *_p(start), *_p(end), *_p(dest))
+
+    #: Number of icon animations the panel can run at once
+    ANIMATIONS = 16
+
+    def draw_icon_anim(self, anim_id:int, pos:tuple[int,int], lib_id:int, first_icon:int, last_icon:int, interval:float, *, start:bool=True, from_end:bool=False):
+        """
+        Show a series of icons as an animation, run by the panel itself.
+        Requires :meth:`commit`.
+
+        The animation keeps going until stopped with :meth:`set_anim`, even if
+        it's drawn over.
+
+        Args:
+            anim_id: Animation slot, 0x0-0xF
+            pos: x,y of upper left
+            lib_id: The library to pull from
+            first_icon: The first icon of the animation
+            last_icon: The last icon of the animation
+            interval: Seconds each icon is shown for, in steps of 0.01
+            start: Start running the animation immediately
+            from_end: Run from the last icon back to the first
+        """
+        assert 0 <= anim_id < self.ANIMATIONS
+        x, y = _p(pos)
+        x, y = min(x, self.width - 1), min(y, self.height - 1)
+        ticks = max(1, min(0xFF, round(interval * 100)))
+        flags = (start << 7) | ((not from_end) << 6) | anim_id
+        self._send(Commands.DRAW_ICON_ANIM, '2HBBBBB', x, y, flags, lib_id, first_icon, last_icon, ticks)
+
+    def set_anim(self, running:int):
+        """
+        Start and stop icon animations.
+
+        Args:
+            running: Bit mask of animation slots; set bits run, clear bits stop
+        """
+        self._send(Commands.SET_ANIM, 'H', running & 0xFFFF)
+
+    #: Size of the panel's data SRAM
+    SRAM_SIZE = 0x8000
+
+    #: Largest amount of data sent in a single memory packet
+    DATA_CHUNK = 0xF0
+
+    def _expect_ack(self, timeout: float) -> typing.Union[concurrent.futures.Future, None]:
+        # Flash writes are acknowledged with 0xA5 'OK'. Only the reader thread
+        # can wait for that without holding up drawing.
+        if self._reader is None or self.recorder is not None:
+            return None
+        return self._reader.expect(FLASH_ACK, timeout, _check_ack)
+
+    def write_data_memory(self, address:int, data:bytes, *, flash:bool=False,
+                          timeout:float=1.0) -> list[concurrent.futures.Future]:
+        """
+        Write to the panel's data memory.
+
+        Added in 2.0.
+
+        Args:
+            address: Where to write; 0x0000-0x7FFF for SRAM, 0x0000-0x3FFF for flash
+            data: What to write. Split into several packets if needed.
+            flash: Write to the 16KB flash instead of the 32KB SRAM
+            timeout: Seconds to wait for each flash write to be acknowledged
+
+        Returns:
+            With the reader thread running, a future for the acknowledgement
+            of each flash packet. SRAM writes aren't acknowledged.
+        """
+        memtype = 0xA5 if flash else 0x5A
+        acks = []
+        for offset in range(0, len(data), self.DATA_CHUNK):
+            chunk = data[offset:offset + self.DATA_CHUNK]
+            if flash and (ack := self._expect_ack(timeout)) is not None:
+                acks.append(ack)
+            self._send(Commands.WRITE_DATA_MEMORY, f'BH{len(chunk)}s', memtype, address + offset, chunk)
+        return acks
+
+    def read_data_memory(self, address:int, length:int, *, flash:bool=False,
+                         timeout:float=1.0) -> concurrent.futures.Future:
+        """
+        Read from the panel's data memory.
+
+        Added in 2.0.
+
+        Args:
+            address: Where to read; 0x0000-0x7FFF for SRAM, 0x0000-0x3FFF for flash
+            length: How many bytes, 0x01-0xF0
+            flash: Read the 16KB flash instead of the 32KB SRAM
+            timeout: Seconds to wait for the answer
+
+        Returns:
+            A future of the bytes read. It is already resolved unless the
+            reader thread is running.
+        """
+        assert 0x01 <= length <= self.DATA_CHUNK
+        return self.request(
+            Commands.READ_DATA_MEMORY, 'BHB', 0xA5 if flash else 0x5A, address, length,
+            timeout=timeout, parse=_parse_memory,
+        )
+
+    def write_picture_memory(self, pic_id:int, *, timeout:float=5.0) -> typing.Union[concurrent.futures.Future, None]:
+        """
+        Save the contents of SRAM (a JPEG) into picture memory, for use with
+        :meth:`draw_jpeg`.
+
+        Added in 2.0.
+
+        Args:
+            pic_id: Picture memory slot, 0x00-0x0F
+            timeout: Seconds to wait for the write to be acknowledged
+
+        Returns:
+            With the reader thread running, a future for the acknowledgement.
+        """
+        assert 0x00 <= pic_id <= 0x0F
+        ack = self._expect_ack(timeout)
+        self._send(Commands.WRITE_PICTURE_MEMORY, 'BBB', 0x5A, 0xA5, pic_id)
+        return ack
+
 
     # Astra: I don't feel like dealing with framebuffer stuff yet
 
@@ -457,59 +1202,6 @@ class T5UIC1_LCD:
     # def JPG_CacheTo1(self, id):
     #     self.JPG_CacheToN(1, id)
 
-    # #  Copy area from virtual display area to current screen
-    # #   cacheID: virtual area number
-    # #   xStart/yStart: Upper-left of virtual area
-    # #   xEnd/yEnd: Lower-right of virtual area
-    # #   x/y: Screen paste point
-    # def Frame_AreaCopy(self, cacheID, xStart, yStart, xEnd, yEnd, x, y):
-    #     self.Byte(0x27)
-    #     self.Byte(0x80 | cacheID)
-    #     self.Word(xStart)
-    #     self.Word(yStart)
-    #     self.Word(xEnd)
-    #     self.Word(yEnd)
-    #     self.Word(x)
-    #     self.Word(y)
-    #     self.Send()
-
-    # def Frame_TitleCopy(self, id, x1, y1, x2, y2):
-    #     self.Frame_AreaCopy(id, x1, y1, x2, y2, 14, 8)
-
-    # #  Animate a series of icons
-    # #   animID: Animation ID; 0x00-0x0F
-    # #   animate: True on; False off;
-    # #   libID: Icon library ID
-    # #   picIDs: Icon starting ID
-    # #   picIDe: Icon ending ID
-    # #   x/y: Upper-left point
-    # #   interval: Display time interval, unit 10mS
-    # def ICON_Animation(self, animID, animate, libID, picIDs, picIDe, x, y, interval):
-    #     if x > self.DWIN_WIDTH - 1:
-    #         x = self.DWIN_WIDTH - 1
-    #     if y > self.DWIN_HEIGHT - 1:
-    #         y = self.DWIN_HEIGHT - 1
-    #     self.Byte(0x28)
-    #     self.Word(x)
-    #     self.Word(y)
-    #     # Bit 7: animation on or off
-    #     # Bit 6: start from begin or end
-    #     # Bit 5-4: unused (0)
-    #     # Bit 3-0: animID
-    #     self.Byte((animate * 0x80) | 0x40 | animID)
-    #     self.Byte(libID)
-    #     self.Byte(picIDs)
-    #     self.Byte(picIDe)
-    #     self.Byte(interval)
-    #     self.Send()
-
-    # #  Animation Control
-    # #   state: 16 bits, each bit is the state of an animation id
-    # def ICON_AnimationControl(self, state):
-    #     self.Byte(0x28)
-    #     self.Word(state)
-    #     self.Send()
-
     # /*---------------------------------------- Memory functions ----------------------------------------*/
     #  The LCD has an additional 32KB SRAM and 16KB Flash
 
@@ -542,12 +1234,3 @@ class T5UIC1_LCD:
     #   PicId: Picture Memory location, 0x00-0x0F
     #
     #   Flash writing returns 0xA5 0x4F 0x4B
-    # def sendPicture(self, PicId, SRAM, Address, data):
-    #   self.Byte(0x31)
-    #   if SRAM:
-    #       self.Byte(0x5A)
-    #   else:
-    #       self.Byte(0xA5)
-    #   self.Word(Address)
-    #   self.DWIN_SendBuf += data
-    #   self.Send()
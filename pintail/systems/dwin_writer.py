@@ -0,0 +1,155 @@
+"""
+Writes encoded frames to the screen from a dedicated thread, so the engine
+never blocks on the UART.
+"""
+import dataclasses
+import collections
+import logging
+import threading
+import time
+import typing
+
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Frame:
+    """
+    One or more committed frames, waiting to be written.
+    """
+    data: bytearray
+    #: The frame paints over the whole screen (clear_screen, draw_jpeg), so
+    #: nothing drawn before it can still be visible
+    full: bool = False
+    #: The frame only draws; dropping it loses no configuration changes
+    replaceable: bool = True
+
+    def merge(self, other: 'Frame'):
+        """
+        Append another frame onto this one.
+        """
+        self.data += other.data
+        self.full |= other.full
+        self.replaceable &= other.replaceable
+
+
+class FrameWriter:
+    """
+    Bounded queue of frames, serviced by a writer thread.
+
+    When the queue is full, the new frame is merged into the newest pending
+    one. A frame that repaints the whole screen replaces any pending frames
+    that only draw.
+
+    :meth:`submit` only blocks once the newest pending frame has grown past
+    :attr:`max_merged_bytes`: the port is not keeping up, and waiting for it
+    bounds the backlog instead of letting it grow without limit.
+    """
+    #: Size past which the newest pending frame stops taking merges. At
+    #: 115200 baud this is a little over a second of writing.
+    max_merged_bytes = 16 * 1024
+
+    def __init__(self, write: typing.Callable[[bytes], typing.Any], drain: typing.Callable[[], None], maxsize: int = 4, name: str = "dwin-writer",
+                 report: typing.Optional[typing.Callable[[int, float, float], None]] = None):
+        """
+        Args:
+            write: Writes bytes to the port
+            drain: Waits for written bytes to leave the port
+            maxsize: Maximum number of frames waiting to be written, at
+                least 1
+            report: Called with the size, write time, and drain time of each
+                frame written
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, not {maxsize}")
+        self._write = write
+        self._drain = drain
+        self._report = report
+        self.maxsize = maxsize
+        self._pending = collections.deque()
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        #: Number of frames dropped because a newer one painted over them
+        self.frames_replaced = 0
+        #: Number of frames merged because the queue was full
+        self.frames_merged = 0
+        #: Number of submits that waited because the backlog was at its cap
+        self.submits_blocked = 0
+        self._thread = threading.Thread(None, self._write_thread, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, data: bytes, *, full: bool = False, replaceable: bool = True):
+        """
+        Queue a frame for writing.
+
+        Blocks while the queue is full and its newest frame has reached
+        :attr:`max_merged_bytes`.
+        """
+        frame = Frame(bytearray(data), full=full, replaceable=replaceable)
+        with self._cond:
+            blocked = False
+            while True:
+                if self._closed:
+                    raise RuntimeError("Writer is closed")
+                if frame.full:
+                    kept = collections.deque(f for f in self._pending if not f.replaceable)
+                    self.frames_replaced += len(self._pending) - len(kept)
+                    self._pending = kept
+                if len(self._pending) < self.maxsize:
+                    self._pending.append(frame)
+                    break
+                if len(self._pending[-1].data) < self.max_merged_bytes:
+                    self._pending[-1].merge(frame)
+                    self.frames_merged += 1
+                    break
+                # Backlog at its cap; wait for the writer to take a frame
+                if not blocked:
+                    blocked = True
+                    self.submits_blocked += 1
+                self._cond.wait()
+            self._cond.notify_all()
+
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait for everything submitted so far to be written and drained.
+
+        Returns False if the timeout expired first.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout: typing.Optional[float] = None):
+        """
+        Finish writing pending frames and stop the thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _write_thread(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    # Closed, and nothing left to do
+                    return
+                frame = self._pending.popleft()
+                self._busy = True
+                # Wake any submit waiting for room
+                self._cond.notify_all()
+            try:
+                t0 = time.perf_counter()
+                self._write(frame.data)
+                t1 = time.perf_counter()
+                self._drain()
+                if self._report is not None:
+                    self._report(len(frame.data), t1 - t0, time.perf_counter() - t1)
+            except Exception:
+                LOG.exception("Error writing frame to screen")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
@@ -1,22 +1,36 @@
 """
 Handles signals, converting them into PPB events
 """
+import logging
 import signal
 
 import ppb
 
+LOG = logging.getLogger(__name__)
+
 
 class Signals(ppb.systemslib.System):
     def __enter__(self):
         signal.signal(signal.SIGINT, self._do_quit)
         signal.signal(signal.SIGHUP, self._do_quit)
         signal.signal(signal.SIGTERM, self._do_quit)
+        signal.signal(signal.SIGUSR1, self._dump_profile)
         # Skipping SIGABRT
 
     def __exit__(self, *exc):
         signal.signal(signal.SIGINT, signal.SIG_DFL)
         signal.signal(signal.SIGHUP, signal.SIG_DFL)
         signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
 
     def _do_quit(self, signum, frame):
-        self.engine.signal(ppb.events.Quit())
\ No newline at end of file
+        self.engine.signal(ppb.events.Quit())
+
+    def _dump_profile(self, signum, frame):
+        # Right away, rather than as an event: the engine may be stuck in the
+        # very handler we're looking for
+        profiler = self.engine.profiler
+        if profiler is None:
+            LOG.info("Not profiling; run with PINTAIL_PROFILE=1")
+        else:
+            LOG.info("%s", profiler.report())
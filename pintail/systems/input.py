@@ -8,6 +8,7 @@ import threading
 import evdev
 from evdev import ecodes
 import ppb
+from ppb.eventqueue import Priority
 
 from .. import events
 
@@ -21,8 +22,22 @@ class Input(ppb.systemslib.System):
 
     _thread = None
     _selector = None
+    _devices = ()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # The knob goes ahead of everything else
+        for kind in (events.KnobPress, events.KnobRelease, events.KnobTurn):
+            self.engine.set_priority(kind, Priority.INPUT)
 
     def __enter__(self):
+        loop = self.engine.loop
+        if loop is not None:
+            # Read on the engine's own loop
+            self._devices = [evdev.InputDevice(path) for path in self.input_devices]
+            for dev in self._devices:
+                loop.add_reader(dev.fd, self._on_readable, dev)
+            return
         self._thread = threading.Thread(None, self._read_thread, name=f"evdev-reader", daemon=True)
         self._thread.start()
 
@@ -30,6 +45,17 @@ class Input(ppb.systemslib.System):
     def __exit__(self, *exc):
         if self._selector is not None:
             self._selector.close()
+        for dev in self._devices:
+            self.engine.loop.remove_reader(dev.fd)
+            dev.close()
+        self._devices = ()
+
+    def _on_readable(self, device):
+        try:
+            for event in device.read():
+                self._decode(event)
+        except BlockingIOError:
+            pass
 
     def _read_thread(self):
         self._selector = selectors.DefaultSelector()
@@ -56,4 +82,8 @@ class Input(ppb.systemslib.System):
             else:
                 self.engine.signal(events.KnobRelease())
         elif ev.type == ecodes.EV_REL and ev.code == ecodes.REL_X:
-            self.engine.signal(events.KnobTurn(direction=events.Direction(ev.value)))
+            if ev.value:
+                self.engine.signal(events.KnobTurn(
+                    direction=events.Direction.CW if ev.value > 0 else events.Direction.CCW,
+                    steps=abs(ev.value),
+                ))
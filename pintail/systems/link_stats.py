@@ -0,0 +1,179 @@
+"""
+Counters for what goes over the serial link to the screen: how many bytes
+and packets each frame and each widget sends, and how long encoding,
+writing, and draining take.
+"""
+import collections
+import dataclasses
+import threading
+import typing
+
+from .dwin_screen import Commands
+
+
+def _nearest_rank(ordered: list, p: float):
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))]
+
+
+class Histogram:
+    """
+    The most recent samples of some measurement.
+    """
+    def __init__(self, size: int = 256):
+        self.samples = collections.deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, p: float) -> float:
+        """
+        The sample at the given percentile (0-100), by nearest rank.
+        """
+        if not self.samples:
+            return 0
+        return _nearest_rank(sorted(self.samples), p)
+
+    def summary(self) -> dict[str, float]:
+        if not self.samples:
+            return {'count': 0}
+        ordered = sorted(self.samples)
+        return {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p50': _nearest_rank(ordered, 50),
+            'p90': _nearest_rank(ordered, 90),
+            'p99': _nearest_rank(ordered, 99),
+            'max': ordered[-1],
+        }
+
+
+def command_name(cmd: int) -> str:
+    try:
+        return Commands(cmd).name
+    except ValueError:
+        return f"{cmd:#04x}"
+
+
+def owner_name(owner) -> str:
+    if owner is None:
+        return "-"
+    return type(owner).__name__
+
+
+@dataclasses.dataclass
+class FrameStats:
+    """
+    What a single rendered frame sent.
+    """
+    #: Bytes sent, including framing
+    bytes: int = 0
+    #: Bytes not sent because the screen already showed them
+    skipped: int = 0
+    #: Bytes saved by optimizing the display list
+    optimized: int = 0
+    #: Seconds spent drawing and encoding the frame
+    encode_time: float = 0
+    #: Packets sent, by command name
+    packets: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    #: Bytes sent, by widget class name
+    widget_bytes: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    #: Packets sent, by widget class name
+    widget_packets: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+
+    def add(self, owner, body: bytes, size: int):
+        name = owner_name(owner)
+        self.bytes += size
+        self.packets[command_name(body[0])] += 1
+        self.widget_bytes[name] += size
+        self.widget_packets[name] += 1
+
+
+class LinkStats:
+    """
+    Rolling statistics of screen traffic.
+
+    Frames are added by the renderer; writes are added by the screen (from the
+    writer thread, if there is one).
+    """
+    def __init__(self, size: int = 256):
+        """
+        Args:
+            size: How many recent samples each histogram keeps
+        """
+        self.size = size
+        self._lock = threading.Lock()
+        self._histograms = {}
+        #: The most recent frames
+        self.frames: collections.deque[FrameStats] = collections.deque(maxlen=size)
+        #: Packets sent since startup, by command name
+        self.packets = collections.Counter()
+        #: Bytes sent since startup, by widget class name
+        self.widget_bytes = collections.Counter()
+
+    def _add(self, name: str, value: float):
+        try:
+            hist = self._histograms[name]
+        except KeyError:
+            hist = self._histograms[name] = Histogram(self.size)
+        hist.add(value)
+
+    def add_frame(self, frame: FrameStats):
+        with self._lock:
+            self.frames.append(frame)
+            self.packets.update(frame.packets)
+            self.widget_bytes.update(frame.widget_bytes)
+            self._add('frame.bytes', frame.bytes)
+            self._add('frame.skipped', frame.skipped)
+            self._add('frame.optimized', frame.optimized)
+            self._add('frame.packets', sum(frame.packets.values()))
+            self._add('frame.encode', frame.encode_time)
+            for name, size in frame.widget_bytes.items():
+                self._add(f'widget.{name}.bytes', size)
+
+    def add_write(self, size: int, write_time: float, drain_time: float):
+        """
+        Record a write to the port.
+        """
+        with self._lock:
+            self._add('link.bytes', size)
+            self._add('link.write', write_time)
+            self._add('link.drain', drain_time)
+
+    def histogram(self, name: str) -> Histogram:
+        with self._lock:
+            return self._histograms.setdefault(name, Histogram(self.size))
+
+    def snapshot(self) -> dict[str, typing.Any]:
+        """
+        Everything, as plain data.
+        """
+        with self._lock:
+            return {
+                'histograms': {name: h.summary() for name, h in self._histograms.items()},
+                'packets': dict(self.packets),
+                'widget_bytes': dict(self.widget_bytes),
+            }
+
+    def summary(self, widgets: int = 5) -> str:
+        """
+        A one-line overview, for logging.
+        """
+        with self._lock:
+            parts = []
+            for name, fmt, scale in (
+                ('frame.bytes', "{:.0f}B", 1),
+                ('frame.encode', "{:.1f}ms", 1000),
+                ('link.write', "{:.1f}ms", 1000),
+                ('link.drain', "{:.1f}ms", 1000),
+            ):
+                s = self._histograms.get(name, Histogram()).summary()
+                if s['count']:
+                    parts.append(
+                        f"{name} p50={fmt.format(s['p50'] * scale)} "
+                        f"p90={fmt.format(s['p90'] * scale)} max={fmt.format(s['max'] * scale)}"
+                    )
+            top = ", ".join(f"{name}={size}B" for name, size in self.widget_bytes.most_common(widgets))
+            return f"{len(self.frames)} frames; " + "; ".join(parts) + f"; heaviest: {top}"
@@ -5,6 +5,7 @@ import logging
 import queue
 
 import ppb
+from ppb.eventqueue import Priority
 
 from .moonraker_rpc import MoonrakerUDS
 from ..events import MoonrakerNotification, DisplayOn, DisplayOff
@@ -18,6 +19,7 @@ class Moonraker(ppb.systemslib.System):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.engine.register(..., self._add_rpc)
+        self.engine.set_priority(MoonrakerNotification, Priority.BACKGROUND)
 
     def _add_rpc(self, event):
         if hasattr(self, 'rpc'):
@@ -27,6 +29,7 @@ class Moonraker(ppb.systemslib.System):
         self.rpc = MoonrakerUDS(
             "/home/astraluma/printer_data/comms/moonraker.sock",
             on_notification=self._moonraker_notification,
+            loop=self.engine.loop,
         )
         LOG.info("Connected to moonraker")
         self.rpc(
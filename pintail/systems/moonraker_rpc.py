@@ -1,3 +1,4 @@
+import asyncio
 import concurrent.futures
 import dataclasses
 import itertools
@@ -38,6 +39,10 @@ class Event:
 class MoonrakerUDS:
     """
     Talk to moonraker over JSON-RPC via Unix Domain Socket
+
+    Responses and notifications are read by a thread, or, if given an asyncio
+    loop, by the loop. On a loop, a call reads its own response, since the
+    loop is busy running the caller.
     """
     _socket: socket.socket
     _future_results: dict[int, concurrent.futures.Future]
@@ -45,7 +50,7 @@ class MoonrakerUDS:
 
     on_notification = staticmethod(lambda ev: None)
 
-    def __init__(self, path, on_notification=None):
+    def __init__(self, path, on_notification=None, loop: typing.Optional[asyncio.AbstractEventLoop] = None):
         self._id_generator = itertools.count()
         self._future_results = dict()
         if on_notification is not None:
@@ -53,10 +58,17 @@ class MoonrakerUDS:
 
         self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self._socket.connect(path)
-        self._thread = threading.Thread(None, self._read_thread, name=f"moonraker-reader:{path}", daemon=True)
-        self._thread.start()
+        self._loop = loop
+        if loop is not None:
+            self._thread = None
+            loop.add_reader(self._socket, self._on_readable)
+        else:
+            self._thread = threading.Thread(None, self._read_thread, name=f"moonraker-reader:{path}", daemon=True)
+            self._thread.start()
 
     def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self._socket)
         self._socket.close()
         self._thread = None
         # Hopefully the read thread kills itself
@@ -77,19 +89,35 @@ class MoonrakerUDS:
 
         return json.loads(packet.decode('utf-8'))
 
+    def _dispatch(self, msg):
+        # print(f"{msg=}", flush=True)
+        if "id" in msg:
+            # Response to a request
+            self._future_results.pop(msg["id"]).set_result(msg)
+        else:
+            # Broadcast event
+            self.on_notification(Event(msg["method"], msg.get("params", [])))
+
     def _read_thread(self):
         while True:
             try:
                 msg = self._read_one()
             except OSError:
                 return
-            # print(f"{msg=}", flush=True)
-            if "id" in msg:
-                # Response to a request
-                self._future_results[msg["id"]].set_result(msg)
-            else:
-                # Broadcast event
-                self.on_notification(Event(msg["method"], msg.get("params", [])))
+            self._dispatch(msg)
+
+    def _on_readable(self):
+        try:
+            data = self._socket.recv(self._bufsize)
+        except OSError:
+            data = b""
+        if not data:
+            self._loop.remove_reader(self._socket)
+            return
+        self._readbuf += data
+        while self._delimiter in self._readbuf:
+            packet, _, self._readbuf = self._readbuf.partition(self._delimiter)
+            self._dispatch(json.loads(packet.decode('utf-8')))
 
     def __call__(self, method: str, /, *pargs, **kwargs):
         """
@@ -111,6 +139,9 @@ class MoonrakerUDS:
 
         self._future_results[reqid] = fut = concurrent.futures.Future()
         self._send(req)
+        if self._loop is not None:
+            while not fut.done():
+                self._dispatch(self._read_one())
         resp = fut.result()
 
         assert resp['id'] == reqid
@@ -1,9 +1,19 @@
+import logging
+import time
+import typing
+
 import ppb
+from ppb.eventqueue import Priority
 from ppb.utils import get_time
 
 from .dwin_screen import T5UIC1_LCD
+from .display_list import DisplayList, DisplayDiffer, framed_size, is_repeatable, optimize
+from .dwin_model import PanelModel
+from .link_stats import FrameStats, LinkStats
 from .. import events
 
+LOG = logging.getLogger(__name__)
+
 
 class PostRender: pass
 
@@ -11,23 +21,90 @@ class PostRender: pass
 class DwinRender(ppb.systemslib.System):
     redraw: bool = False
 
-    def __init__(self, **kwargs):
+    #: Bytes not sent in the last frame because the screen already showed them
+    bytes_skipped: int = 0
+    #: Bytes saved in the last frame by :func:`~.display_list.optimize`
+    bytes_optimized: int = 0
+
+    #: Serial port the screen is on, or several to look for it on. Every port
+    #: listed gets sent handshakes, so leave out ones other things use.
+    screen_port: typing.Union[str, tuple[str, ...]] = "/dev/ttyAMA1"
+
+    #: Seconds between logging link statistics; 0 to never log them
+    stats_interval: float = 60
+
+    #: Most frames drawn per second. Anything dirtied in between is drawn
+    #: together in the next frame.
+    max_fps: float = 20
+    #: Most frames per second while the knob is being used, so that feedback
+    #: isn't held back by the normal cap
+    max_input_fps: float = 60
+
+    def __init__(self, engine=None, screen_port=None, stats_interval=None, max_fps=None, max_input_fps=None, **kwargs):
+        self.engine = engine
+        if engine is not None:
+            # A frame is finished before anything else happens
+            engine.set_priority(events.Render, Priority.RENDER)
+            engine.set_priority(PostRender, Priority.RENDER)
+        if max_fps is not None:
+            self.max_fps = max_fps
+        if max_input_fps is not None:
+            self.max_input_fps = max_input_fps
+        if screen_port is not None:
+            self.screen_port = screen_port
+        if stats_interval is not None:
+            self.stats_interval = stats_interval
+        #: Traffic to the screen, per frame and per widget
+        self.stats = LinkStats()
+        self._stats_logged = get_time()
+        self._frame_started = None
         self.last_draw = get_time()
+        #: The next frame was asked for by input
+        self._input = False
+        #: The timer service, while a wakeup for the next frame is set
+        self._wakeup = None
+        self.differ = DisplayDiffer()
+        self.display_list = None
+        #: What we believe the panel is showing
+        self.shadow = PanelModel()
+        #: The areas of the screen changed by the last frame
+        self.damage = []
 
     def __enter__(self):
-        self.screen = T5UIC1_LCD("/dev/ttyAMA1")
+        if isinstance(self.screen_port, str):
+            self.screen = T5UIC1_LCD(self.screen_port)
+        else:
+            self.screen = T5UIC1_LCD.find(self.screen_port)
+        self.screen.stats = self.stats
         self.screen.set_brightness(0xFF)
         self.screen.draw_jpeg(0)
         self.screen.commit()
+        self.screen.start_writer()
+        self.screen.start_reader()
 
     def __exit__(self, *exc):
+        if self._wakeup is not None:
+            self._wakeup.cancel("render", owner=self)
+            self._wakeup = None
+        self.screen.close()
         del self.screen
 
+    def stop_animations(self):
+        """
+        Stop every icon animation running on the panel.
+        """
+        if self.shadow.running:
+            LOG.debug("Stopping animations %#06x", self.shadow.running)
+            self.screen.set_anim(0)
+            self.shadow.running = 0
+
     def on_quit(self, event, signal):
         if hasattr(self, 'screen'):
+            self.stop_animations()
             self.screen.clear_screen(0)
             self.screen.set_brightness(0)
             self.screen.commit()
+            self.screen.wait_sent(timeout=5)
 
     def on_display_on(self, event, signal):
         self.screen.set_brightness(0xFF)
@@ -39,26 +116,109 @@ class DwinRender(ppb.systemslib.System):
 
     def on_ui_dirtied(self, event, signal):
         self.redraw = True
+        # Dirtied during an Idle; make sure another one comes along
+        self._schedule(event)
+
+    def on_knob_turn(self, event, signal):
+        self._input = True
+
+    def on_knob_press(self, event, signal):
+        self._input = True
+
+    def on_knob_release(self, event, signal):
+        self._input = True
+
+    def on_timer(self, event, signal):
+        if event.name == "render":
+            # The Idle that follows draws the frame
+            self._wakeup = None
+
+    def _next_frame(self) -> float:
+        """
+        The earliest time the next frame may be drawn.
+        """
+        fps = self.max_input_fps if self._input else self.max_fps
+        return self.last_draw + 1 / fps if fps else self.last_draw
+
+    def _schedule(self, event):
+        """
+        Arrange for an Idle once the next frame is due.
+        """
+        timers = getattr(event, 'timers', None)
+        if timers is None or self._wakeup is not None:
+            return
+        timers.after(max(0, self._next_frame() - get_time()), "render", owner=self)
+        self._wakeup = timers
 
     def on_scene_started(self, event, signal):
         self.redraw = True
+        # Whatever the last scene left on screen is about to be painted over
+        self.differ.reset()
+        self.stop_animations()
 
     def on_scene_continued(self, event, signal):
         self.redraw = True
+        self.differ.reset()
+        self.stop_animations()
 
     def on_idle(self, event, signal):
         t = get_time()
         if self.redraw:
+            if t < self._next_frame():
+                # Too soon; everything dirtied until then goes in one frame
+                self._schedule(event)
+                return
             # Do a render
+            self._input = False
+            self.display_list = DisplayList()
             signal(ppb.events.PreRender(t - self.last_draw))
-            signal(events.Render(screen=self.screen))
+            signal(events.Render(screen=self.screen, display_list=self.display_list))
             signal(PostRender())
             self.last_draw = t
 
+    def on_pre_render(self, event, signal):
+        # Collect everything drawn this frame into a single write
+        self._frame_started = time.perf_counter()
+        self.screen.begin_frame()
+        self.screen.recorder = self.display_list
+
     def on_render(self, event, signal):
         # We are assuming that any dirty events beyond this point need to start
         # the render process all over
         self.redraw = False
 
     def on_post_render(self, event, signal):
+        self.screen.recorder = None
+        if self.display_list is not None:
+            entries, self.bytes_skipped = self.differ.diff(self.display_list)
+            entries, self.bytes_optimized = optimize(entries)
+            frame = FrameStats(optimized=self.bytes_optimized)
+            self.damage = []
+            for entry in entries:
+                body = entry.body
+                damage = self.shadow.apply(body)
+                if damage is None and is_repeatable(body):
+                    # Wouldn't change a single pixel
+                    self.bytes_skipped += framed_size(body)
+                    continue
+                if damage is not None:
+                    self.damage.append(damage)
+                self.screen.send_raw(body)
+                frame.add(entry.owner, body, framed_size(body))
+            self.display_list = None
+            frame.skipped = self.bytes_skipped
+            if self._frame_started is not None:
+                frame.encode_time = time.perf_counter() - self._frame_started
+            self.stats.add_frame(frame)
+            LOG.debug(
+                "Frame sent %d packets (%d bytes) in %.1fms, skipped %d bytes, optimized away %d bytes, damaged %r",
+                sum(frame.packets.values()), frame.bytes, frame.encode_time * 1000, self.bytes_skipped,
+                self.bytes_optimized, self.damage,
+            )
         self.screen.commit()
+        self._frame_started = None
+
+        now = get_time()
+        if self.stats_interval and now - self._stats_logged >= self.stats_interval:
+            self._stats_logged = now
+            LOG.info("Screen link: %s", self.stats.summary())
@@ -0,0 +1,69 @@
+"""
+Measuring and fitting text in the panel's built-in fonts.
+
+Results are cached, since the same labels are laid out on every redraw.
+"""
+import dataclasses
+import functools
+
+from . import imdata
+from .systems.dwin_screen import Font
+
+
+@dataclasses.dataclass(frozen=True)
+class TextLayout:
+    #: What to draw
+    text: str
+    #: Width in pixels
+    width: int
+    height: int
+    #: Whether the text was cut short to fit
+    truncated: bool = False
+
+
+def advance(font: Font, char: str, *, monospace: bool = True) -> int:
+    """
+    How far a character moves the pen, in pixels.
+    """
+    if monospace:
+        return font.x
+    return imdata.GLYPH_ADVANCES.get(int(font), {}).get(char, font.x)
+
+
+@functools.lru_cache(maxsize=512)
+def measure_text(font: Font, text: str, *, monospace: bool = True) -> int:
+    """
+    The width of a line of text, in pixels.
+    """
+    if monospace:
+        return len(text) * font.x
+    return sum(advance(font, c, monospace=False) for c in text)
+
+
+@functools.lru_cache(maxsize=256)
+def layout_text(font: Font, text: str, max_width: int, *, monospace: bool = True, ellipsis: str = "...") -> TextLayout:
+    """
+    Fit a line of text into a width, cutting it short if it doesn't fit.
+
+    Args:
+        font: Font it will be drawn in
+        text: What to fit
+        max_width: Room available, in pixels
+        monospace: Whether it will be drawn monospace
+        ellipsis: Put at the end of text that was cut short, if it fits
+    """
+    width = measure_text(font, text, monospace=monospace)
+    if width <= max_width:
+        return TextLayout(text, width, font.y)
+
+    tail = measure_text(font, ellipsis, monospace=monospace)
+    if tail > max_width:
+        ellipsis, tail = "", 0
+    width = tail
+    end = 0
+    for end, char in enumerate(text):
+        step = advance(font, char, monospace=monospace)
+        if width + step > max_width:
+            break
+        width += step
+    return TextLayout(text[:end] + ellipsis, width, font.y, truncated=True)
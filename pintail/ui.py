@@ -4,8 +4,16 @@ A basic UI framework.
 Handles focus, dirty-prop rendering, and other stuff.
 """
 import ppb
+from ppb import Vector as V
+from ppb.gomlib import tree_generation
 
-from . import events
+from . import events, imdata
+from .systems.dwin_screen import number_length
+from .textlayout import layout_text
+
+#: Changes whenever any :attr:`Sprite.knobindex` is set, so scenes know to
+#: re-sort their focus rings
+_knobindex_generation = 0
 
 
 class Drawable:
@@ -16,7 +24,11 @@ class Drawable:
 
     def on_render(self, event, signal):
         if self.is_dirty:
-            self.redraw(event.screen)
+            if event.display_list is not None:
+                with event.display_list.drawing(self):
+                    self.redraw(event.screen)
+            else:
+                self.redraw(event.screen)
             self.is_dirty = False
 
     def redraw(self, screen):
@@ -29,6 +41,11 @@ class Drawable:
         self.is_dirty = True
         signal(events.UiDirtied())
 
+    def _redraw_changes(self, signal):
+        # Not set_dirty(); what's on screen is still good to build on
+        self.is_dirty = True
+        signal(events.UiDirtied())
+
     def on_idle(self, event, signal):
         if self.__dirty_fields__ is None:
             return
@@ -52,29 +69,43 @@ class Scene(Drawable, ppb.Scene):
                 c.set_dirty(signal)
                 # FIXME: We probably don't need a UIDirtied event for every element
 
+    #: Focusable children in knob order, and where each is in it
+    _ring = ()
+    _ring_index = None
+    #: What the ring was built from; see :meth:`focus_ring`
+    _ring_key = None
+
+    def focus_ring(self) -> tuple:
+        """
+        The children the knob moves focus between, in :attr:`Sprite.knobindex`
+        order.
+
+        Only rebuilt after the object tree or a knobindex has changed.
+        """
+        key = tree_generation(), _knobindex_generation
+        if key != self._ring_key:
+            self._ring = tuple(sorted(
+                (c for c in self.children.get(kind=Sprite) if hasattr(c, 'knobindex')),
+                key=lambda o: o.knobindex,
+            ))
+            self._ring_index = {c: i for i, c in enumerate(self._ring)}
+            self._ring_key = key
+        return self._ring
+
     def on_knob_turn(self, event, signal):
-        controls = sorted(
-            (c for c in self.children.get(kind=Sprite) if hasattr(c, 'knobindex')),
-            key=lambda o: o.knobindex,
-        )
         old = self.current_focus
-        if old is None:
-            if controls:
-                new = controls[0]
-            else:
-                new = None
+        if old is not None and hasattr(old, 'wants_knob') and old.wants_knob(event.direction):
+            # The focused control is using the knob itself
+            old.turn_knob(event.direction, signal, event.steps)
+            return
+        ring = self.focus_ring()
+        if not ring:
+            new = None
+        elif old is None or old not in self._ring_index:
+            new = ring[0]
         else:
-            try:
-                idx = controls.index(old)
-            except ValueError:
-                # Terrible, but better than nothing
-                # FIXME: do better
-                if controls:
-                    new = controls[0]
-                else:
-                    new = None
-            else:
-                new = controls[(idx + int(event.direction)) % len(controls)]
+            idx = self._ring_index[old]
+            new = ring[(idx + int(event.direction) * event.steps) % len(ring)]
 
         if old is not None:
             signal(events.Blur(), targets=[old])
@@ -92,13 +123,254 @@ class Scene(Drawable, ppb.Scene):
 
 
 class Sprite(Drawable, ppb.RectangleSprite):
-    knobindex: int
     has_focus: bool = False
 
+    @property
+    def knobindex(self) -> int:
+        """
+        Where this comes in the knob's focus order. Sprites without one
+        can't be focused.
+        """
+        try:
+            return self._knobindex
+        except AttributeError:
+            raise AttributeError("knobindex") from None
+
+    @knobindex.setter
+    def knobindex(self, value: int):
+        global _knobindex_generation
+        self._knobindex = value
+        _knobindex_generation += 1
+
     def on_focus(self, event, signal):
         self.has_focus = True
         self.set_dirty(signal)
 
     def on_blur(self, event, signal):
         self.has_focus = False
-        self.set_dirty(signal)
\ No newline at end of file
+        self.set_dirty(signal)
+
+
+class AnimatedIcon(Sprite):
+    """
+    A series of icons, animated by the panel itself.
+
+    Once drawn, it costs nothing to keep running. The renderer stops all
+    animations when the scene changes.
+    """
+    __dirty_fields__ = 'anim_id', 'first_icon', 'last_icon', 'interval', 'running'
+
+    #: Animation slot, 0-15; must be unique among the icons on screen
+    anim_id: int = 0
+    lib_id: int = 9
+    first_icon: int
+    last_icon: int
+    #: Seconds per icon
+    interval: float = 0.1
+    running: bool = True
+
+    @property
+    def width(self):
+        return imdata.ICONS[self.first_icon].width
+
+    @property
+    def height(self):
+        return imdata.ICONS[self.first_icon].height
+
+    def redraw(self, screen):
+        screen.draw_icon_anim(
+            self.anim_id, self.top_left, self.lib_id,
+            self.first_icon, self.last_icon, self.interval,
+            start=self.running,
+        )
+
+
+class ScrollList(Sprite):
+    """
+    A column of rows, scrolled with the knob while focused.
+
+    Scrolling moves what's already on screen with
+    :meth:`~pintail.systems.dwin_screen.T5UIC1_LCD.move_area` and only draws
+    the rows that come into view, so a step costs the same however many rows
+    are showing. Once the selection reaches either end, the knob moves focus
+    on as normal.
+
+    Override :meth:`draw_row` to change how rows look.
+    """
+    __dirty_fields__ = 'items', 'row_height', 'visible_rows', 'font'
+
+    items: tuple[str, ...] = ()
+    row_height: int = 24
+    visible_rows: int = 5
+    font: tuple[int, int] = (10, 20)
+    bg_color: int = 0x00_00_00
+    fg_color: int = 0xFF_FF_FF
+    select_color: int = 0x00_00_FF
+
+    #: Index of the selected item
+    selected: int = 0
+    #: Index of the item in the top row
+    offset: int = 0
+
+    #: (offset, selected) as last drawn, or None if the screen needs a full redraw
+    _shown = None
+
+    @property
+    def height(self):
+        return self.row_height * self.visible_rows
+
+    def set_dirty(self, signal):
+        self._shown = None
+        super().set_dirty(signal)
+
+    def wants_knob(self, direction) -> bool:
+        return self.has_focus and 0 <= self.selected + int(direction) < len(self.items)
+
+    def turn_knob(self, direction, signal, steps: int = 1):
+        """
+        Move the selection, scrolling it into view.
+        """
+        self.selected = max(0, min(len(self.items) - 1, self.selected + int(direction) * steps))
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.visible_rows:
+            self.offset = self.selected - self.visible_rows + 1
+        self._redraw_changes(signal)
+
+    def on_focus(self, event, signal):
+        self.has_focus = True
+        self._redraw_changes(signal)
+
+    def on_blur(self, event, signal):
+        self.has_focus = False
+        self._redraw_changes(signal)
+
+    def on_knob_press(self, event, signal):
+        if self.has_focus and self.items:
+            self.activate(event, signal)
+
+    def activate(self, event, signal):
+        pass
+
+    def row_top_left(self, row: int):
+        return self.top_left - V(0, row * self.row_height)
+
+    def draw_row(self, screen, index: int, row: int):
+        """
+        Draw ``items[index]`` in the ``row``-th visible row.
+        """
+        font = screen.Font.s(*self.font)
+        tl = self.row_top_left(row)
+        selected = index == self.selected and self.has_focus
+        bg = screen.RGB(self.select_color if selected else self.bg_color)
+        screen.draw_rect(screen.RectMode.FILLED, bg, tl, tl + V(self.width - 1, 1 - self.row_height))
+        screen.draw_text(
+            tl - V(0, (self.row_height - font.y) // 2), font, layout_text(font, self.items[index], self.width).text,
+            fg_color=screen.RGB(self.fg_color),
+            bg_color=None,
+            monospace=True,
+        )
+
+    def _draw_rows(self, screen, rows):
+        for row in sorted(set(rows)):
+            index = self.offset + row
+            if 0 <= row < self.visible_rows and index < len(self.items):
+                self.draw_row(screen, index, row)
+
+    def redraw(self, screen):
+        shown, self._shown = self._shown, (self.offset, self.selected)
+        if shown is not None:
+            old_offset, old_selected = shown
+            delta = self.offset - old_offset
+            if abs(delta) < self.visible_rows:
+                if delta:
+                    screen.move_area(
+                        screen.MoveMode.TRANSLATE,
+                        screen.MoveDir.UP if delta > 0 else screen.MoveDir.DOWN,
+                        abs(delta) * self.row_height, screen.RGB(self.bg_color),
+                        self.top_left, self.top_left + V(self.width - 1, 1 - self.height),
+                    )
+                exposed = (
+                    range(self.visible_rows - delta, self.visible_rows) if delta > 0
+                    else range(0, -delta)
+                )
+                # The old selection needs unhighlighting, the new one highlighting
+                self._draw_rows(screen, [*exposed, old_selected - self.offset, self.selected - self.offset])
+                return
+
+        screen.draw_rect(
+            screen.RectMode.FILLED, screen.RGB(self.bg_color),
+            self.top_left, self.top_left + V(self.width - 1, 1 - self.height),
+        )
+        self._draw_rows(screen, range(self.visible_rows))
+
+
+class NumericField(Sprite):
+    """
+    A number, redrawn in place as it changes.
+
+    Each update is a single self-erasing
+    :meth:`~pintail.systems.dwin_screen.T5UIC1_LCD.draw_number`, sent only
+    when the value as shown (rounded to :attr:`fmt`'s precision) changes. If
+    the number gets narrower, as when a minus sign goes away, only the
+    leftover strip is cleared.
+    """
+    __dirty_fields__ = 'fmt', 'font', 'fg_color', 'bg_color'
+
+    value: float = 0
+    #: See :meth:`~pintail.systems.dwin_screen.T5UIC1_LCD.draw_number`
+    fmt: str = '3'
+    font: tuple[int, int] = (10, 20)
+    fg_color: int = 0xFF_FF_FF
+    bg_color: int = 0x00_00_00
+
+    #: Value as last drawn
+    _drawn_value = None
+    #: Width in pixels as last drawn, or None if the screen needs a full redraw
+    _shown_width = None
+
+    @property
+    def precision(self) -> int:
+        return int(self.fmt.partition('.')[2] or 0)
+
+    @property
+    def shown_value(self) -> int:
+        """
+        The value in units of the last digit shown.
+        """
+        return round(self.value * 10 ** self.precision)
+
+    @property
+    def width(self):
+        # Wide enough for a minus sign
+        return self.font[0] * number_length(self.fmt, -1)
+
+    @property
+    def height(self):
+        return self.font[1]
+
+    def set_dirty(self, signal):
+        self._shown_width = None
+        super().set_dirty(signal)
+
+    def on_idle(self, event, signal):
+        super().on_idle(event, signal)
+        if not self.is_dirty and self.shown_value != self._drawn_value:
+            self._redraw_changes(signal)
+
+    def redraw(self, screen):
+        font = screen.Font.s(*self.font)
+        bg = screen.RGB(self.bg_color)
+        self._drawn_value = self.shown_value
+        width = font.x * number_length(self.fmt, self.value)
+        shown, self._shown_width = self._shown_width, width
+        end = self.width if shown is None else shown
+        if width < end:
+            screen.draw_rect(
+                screen.RectMode.FILLED, bg,
+                self.top_left + V(width, 0), self.top_left + V(end - 1, 1 - font.y),
+            )
+        screen.draw_number(
+            self.top_left, font, self.fmt, self.value,
+            fg_color=screen.RGB(self.fg_color), bg_color=bg,
+        )
@@ -5,6 +5,8 @@ from ppb import Vector as V
 
 from . import ui
 from . import events
+from .textlayout import measure_text
+from .systems.dwin_screen import Font
 
 
 @dataclasses.dataclass
@@ -123,7 +125,7 @@ class PopupMsg(ui.Scene):
         font = screen.Font.s(*self.font)
         rect = BorderRect.from_content_pos(
             pos=V(screen.width, screen.height)/2,
-            content_size=(len(self.text) * font.x, font.y),
+            content_size=(measure_text(font, self.text), font.y),
             border=self.border,
             padding=self.padding,
         )
@@ -166,7 +168,7 @@ class IconedMenuItem(ui.Sprite):
 
     @property
     def width(self):
-        return 2 * self.border + 2 * self.padding + len(self.text) * self.font[0] + self.icon_size + self.icon_padding
+        return 2 * self.border + 2 * self.padding + measure_text(Font.s(*self.font), self.text) + self.icon_size + self.icon_padding
 
     @property
     def height(self):
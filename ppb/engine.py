@@ -3,6 +3,8 @@ The core engine of PPB. This manages systems, the scene stack, initialization,
 the event loop, the Idle event, and other aspects.
 """
 
+import asyncio
+import functools
 import time
 from collections import defaultdict
 from contextlib import ExitStack
@@ -10,10 +12,12 @@ from itertools import chain
 from typing import Any
 from typing import Callable
 from typing import DefaultDict
+from typing import Dict
 from typing import Hashable
 from typing import Iterable
 from typing import Iterator
 from typing import List
+from typing import Tuple
 from typing import Type
 from typing import Union
 import queue
@@ -28,6 +32,9 @@ from ppb.gomlib import walk
 from ppb.errors import BadChildException
 from ppb.errors import NotMyChildError
 from ppb.errors import BadEventHandlerException
+from ppb.eventqueue import Priority
+from ppb.eventqueue import PriorityEventQueue
+from ppb.profiler import EventProfiler
 from ppb.scenes import Scene
 from ppb.systems import Updater
 from ppb.utils import LoggingMixin
@@ -55,6 +62,26 @@ for x in events.__all__:
     _get_handler_name(x)
 
 
+#: Priorities of the engine's own events; see :meth:`GameEngine.set_priority`
+DEFAULT_PRIORITIES = {
+    events.StartScene: Priority.SCENE,
+    events.StopScene: Priority.SCENE,
+    events.ReplaceScene: Priority.SCENE,
+    events.Quit: Priority.SCENE,
+    events.PreRender: Priority.RENDER,
+    events.Render: Priority.RENDER,
+    events.Update: Priority.BACKGROUND,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _class_handlers(cls: Type) -> frozenset:
+    """
+    The names of the event handlers a class defines, or might.
+    """
+    return frozenset(name for name in dir(cls) if name.startswith("on_"))
+
+
 class EngineChildren(Children):
     """
     Acts as a Children collection for engines:
@@ -84,10 +111,9 @@ class EngineChildren(Children):
         )
 
     def __iter__(self) -> Iterator[GameObject]:
-        yield from self._systems
-        if self._scenes:
-            yield self._scenes[-1]
-        yield from self._all
+        if self._order is None:
+            self._order = (*self._systems, *self._scenes[-1:], *self._all)
+        return iter(self._order)
 
     def __len__(self) -> int:
         return len(self._all)
@@ -137,10 +163,9 @@ class EngineChildren(Children):
         else:
             self._all.add(child)
 
-        for kind in type(child).mro():
-            self._kinds[kind].add(child)
-        for tag in tags:
-            self._tags[tag].add(child)
+        self._index(child, tags)
+        self._changed()
+        self._notify(child, True)
 
         return child
 
@@ -172,10 +197,9 @@ class EngineChildren(Children):
             except KeyError as exc:
                 raise NotMyChildError() from exc
 
-        for kind in type(child).mro():
-            self._kinds[kind].remove(child)
-        for s in self._tags.values():
-            s.discard(child)
+        self._unindex(child)
+        self._changed()
+        self._notify(child, False)
 
         return child
 
@@ -185,10 +209,14 @@ class EngineChildren(Children):
 
         If you are not an Engine, you probably don't want to call this.
         """
+        paused = self.current_scene
         self._scenes.append(scene)
-
-        for kind in type(scene).mro():
-            self._kinds[kind].add(scene)
+        self._index(scene, ())
+        self._changed()
+        # Only the top scene is a child
+        if paused is not None:
+            self._notify(paused, False)
+        self._notify(scene, True)
 
     def pop_scene(self):
         """
@@ -197,10 +225,11 @@ class EngineChildren(Children):
         If you are not an Engine, you probably don't want to call this.
         """
         child = self._scenes.pop()
-        for kind in type(child).mro():
-            self._kinds[kind].remove(child)
-        for s in self._tags.values():
-            s.discard(child)
+        self._unindex(child)
+        self._changed()
+        self._notify(child, False)
+        if self.current_scene is not None:
+            self._notify(self.current_scene, True)
 
     def __enter__(self):
         assert not self.entered
@@ -235,7 +264,9 @@ class GameEngine(GameObject, LoggingMixin):
     """
     def __init__(self, first_scene: Union[Type, Scene], *,
                  basic_systems=(Updater, AssetLoadingSystem),
-                 systems=(), scene_kwargs=None, **kwargs):
+                 systems=(), scene_kwargs=None,
+                 idle_interval: float = 0, idle_when_drained: bool = False,
+                 idle_on_request: bool = False, profile: bool = False, **kwargs):
         """
         :param first_scene: A :class:`~ppb.Scene` type.
         :type first_scene: Union[Type, scenes.Scene]
@@ -248,6 +279,19 @@ class GameEngine(GameObject, LoggingMixin):
         :type systems: Iterable[systemslib.System]
         :param scene_kwargs: Keyword arguments passed along to the first scene.
         :type scene_kwargs: Dict[str, Any]
+        :param idle_interval: Minimum seconds between :class:`~events.Idle`
+           events. Events arriving sooner share a later Idle.
+        :type idle_interval: float
+        :param idle_when_drained: Hold the :class:`~events.Idle` back while
+           more events are waiting, so a burst of events shares one.
+           Background events don't hold it back.
+        :type idle_when_drained: bool
+        :param idle_on_request: Only send an :class:`~events.Idle` after
+           :meth:`request_idle` is called.
+        :type idle_on_request: bool
+        :param profile: Time every event handler and queued event; see
+           :attr:`profiler`.
+        :type profile: bool
         :param kwargs: Additional keyword arguments. Passed to the systems.
 
         .. warning::
@@ -264,12 +308,36 @@ class GameEngine(GameObject, LoggingMixin):
         self.kwargs = kwargs
 
         # Engine State
-        self.eventqueue = queue.SimpleQueue()
+        self.event_priorities = dict(DEFAULT_PRIORITIES)
+        self.eventqueue = PriorityEventQueue(self.event_priorities)
         self.event_extensions: DefaultDict[Union[Type, _ellipsis], List[Callable[[Any], None]]] = defaultdict(list)
         self.entered = False
         self.running = False
         self._last_idle_time = None
 
+        # Idle policy
+        self.idle_interval = idle_interval
+        self.idle_when_drained = idle_when_drained
+        self.idle_on_request = idle_on_request
+        self._idle_pending = False
+
+        #: The asyncio event loop driving the engine, if it's run with
+        #: :meth:`run_async`
+        self.loop: Union[asyncio.AbstractEventLoop, None] = None
+        self._wakeup = None
+        self._dispatching = False
+
+        #: Times handlers and queued events, if set. See :mod:`ppb.profiler`.
+        self.profiler: Union[EventProfiler, None] = EventProfiler() if profile else None
+
+        # Handler name -> objects with that handler, in the order they were
+        # indexed. Built on the first broadcast.
+        self._subscribers: Union[DefaultDict[str, Dict[GameObject, None]], None] = None
+        # Object -> the handler names it was indexed under
+        self._subscribed: Dict[GameObject, frozenset] = {}
+        # Handler name -> its subscribers, as of the last change to them
+        self._subscriber_lists: Dict[str, Tuple[GameObject, ...]] = {}
+
         # Systems
         self.systems_classes = list(chain(basic_systems, systems))
 
@@ -323,6 +391,47 @@ class GameEngine(GameObject, LoggingMixin):
             self.start()
             self.main_loop()
 
+    def run_async(self):
+        """
+        Begin the main loop, driven by an asyncio event loop.
+
+        Systems see the loop as :attr:`loop` when they are entered, and can
+        register their file descriptors and timers with it instead of running
+        threads of their own. Events are dispatched on the loop's thread.
+
+        Must not be called when already in an event loop. Example: ::
+
+           GameEngine(Scene, **kwargs).run_async()
+        """
+        asyncio.run(self._run_async())
+
+    async def _run_async(self):
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            with self:
+                self.start()
+                await self._async_main_loop()
+        finally:
+            self.loop = None
+
+    async def _async_main_loop(self):
+        while self.running:
+            if self.eventqueue.empty():
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._idle_timeout())
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Let due timers and readable descriptors in between events
+                await asyncio.sleep(0)
+            try:
+                event = self._get_event(block=False)
+            except queue.Empty:
+                event = None
+            self._dispatch(event)
+
     def start(self):
         """
         Starts the engine.
@@ -362,29 +471,87 @@ class GameEngine(GameObject, LoggingMixin):
         if not self.entered:
             raise ValueError("Cannot run before things have started",
                              self.entered)
-        # Wait for an event
-        event = self.eventqueue.get(block=True, timeout=None)
-        self.publish(event)
+        # Wait for an event, or until a held back Idle is due
+        try:
+            event = self._get_event(block=True, timeout=self._idle_timeout())
+        except queue.Empty:
+            event = None
+        self._dispatch(event)
 
-        # Handle all the spawned events
-        self._publish_events()
+    def _dispatch(self, event):
+        """
+        Publish an event (if there is one), what it spawns, and an Idle if
+        one is due.
+        """
+        self._dispatching = True
+        try:
+            if event is not None:
+                self.publish(event)
 
-        # We've done the event that woke us, do an Idle
-        now = get_time()
-        self.signal(events.Idle(now - self._last_idle_time))
-        self._last_idle_time = now
-        # We loop through signal for targets handling
+                # Handle all the spawned events
+                self._publish_events()
 
-        # And handle all the events that spawned from the idle
-        self._publish_events()
+                if not self.idle_on_request:
+                    self._idle_pending = True
 
-    def _publish_events(self):
+            # We've done the event that woke us, do an Idle
+            if self._idle_due():
+                self._idle_pending = False
+                now = get_time()
+                self.signal(events.Idle(now - self._last_idle_time))
+                self._last_idle_time = now
+                # We loop through signal for targets handling
+
+                # And handle all the events that spawned from the idle
+                self._publish_events()
+        finally:
+            self._dispatching = False
+
+    def _get_event(self, block: bool, timeout: Union[float, None] = None):
+        """
+        Take the next event from the queue, for the profiler to see.
+        """
+        event = self.eventqueue.get(block=block, timeout=timeout)
+        if self.profiler is not None:
+            self.profiler.dequeued(event, self.eventqueue.last_wait, self.eventqueue.last_depth)
+        return event
+
+    def _idle_timeout(self) -> Union[float, None]:
+        """
+        How long to wait for an event before sending a held back Idle.
         """
-        Publishes the contents of the eventqueue
+        if not self._idle_pending:
+            return None
+        return max(0, self._last_idle_time + self.idle_interval - get_time())
+
+    def _idle_due(self) -> bool:
+        if not self._idle_pending:
+            return False
+        if self.idle_when_drained and self.eventqueue.has_urgent():
+            return False
+        return get_time() - self._last_idle_time >= self.idle_interval
+
+    def request_idle(self):
+        """
+        Ask for an :class:`~events.Idle` once the current event is handled.
+
+        Only needed with ``idle_on_request``. Call from an event handler;
+        other threads should signal an event whose handler calls this.
+        """
+        self._idle_pending = True
+
+    def _publish_events(self, everything: bool = False):
+        """
+        Publishes the contents of the eventqueue, except for background
+        events, which wait for the next loop.
+
+        :param everything: Publish background events too, until the queue is
+           empty. For changing scenes, so nothing is left for the next one.
         """
-        while True:
+        waiting = self.eventqueue.qsize if everything else self.eventqueue.has_urgent
+        while waiting():
             try:
-                event = self.eventqueue.get(block=False)
+                event = self._get_event(block=False)
             except queue.Empty:
                 break
             else:
@@ -408,12 +575,16 @@ class GameEngine(GameObject, LoggingMixin):
             targets = list(event.__targets__)  # Reify the WeakSet for consistency
         else:
             # A general broadcast event
-            targets = walk(self)
+            targets = self._get_subscribers(event_handler_name)
+        profiler = self.profiler
         for obj in targets:
             method = getattr(obj, event_handler_name, None)
             if callable(method):
                 try:
-                    method(event, self.signal)
+                    if profiler is None:
+                        method(event, self.signal)
+                    else:
+                        profiler.call(event, obj, event_handler_name, method, event, self.signal)
                 except TypeError as ex:
                     from inspect import signature
                     sig = signature(method)
@@ -424,6 +595,67 @@ class GameEngine(GameObject, LoggingMixin):
                     else:
                         raise
 
+    def _get_subscribers(self, event_handler_name: str) -> Tuple[GameObject, ...]:
+        """
+        Everything in the tree that might handle an event.
+
+        The index is built from a walk of the tree on the first broadcast, and
+        kept up to date from then on as children are added and removed and
+        scenes are pushed and popped. Objects added later come after the ones
+        already indexed.
+
+        Handlers are looked up by class, plus whatever is in an object's
+        ``__dict__`` when it's indexed. A handler set on an instance after it
+        joined the tree is not seen until it is removed and added again.
+        """
+        if self._subscribers is None:
+            self._subscribers = defaultdict(dict)
+            self._subscribe(self)
+        try:
+            return self._subscriber_lists[event_handler_name]
+        except KeyError:
+            targets = tuple(self._subscribers.get(event_handler_name, ()))
+            self._subscriber_lists[event_handler_name] = targets
+            return targets
+
+    def _subscribe(self, root):
+        """
+        Add an object and everything below it to the subscriber index, and
+        watch their children for changes.
+        """
+        for obj in walk(root):
+            children = getattr(obj, "children", None)
+            if isinstance(children, Children):
+                children._listener = self._tree_edited
+            if obj in self._subscribed:
+                continue
+            names = _class_handlers(type(obj))
+            attrs = getattr(obj, "__dict__", None)
+            if attrs:
+                names = names.union(name for name in attrs if name.startswith("on_"))
+            self._subscribed[obj] = names
+            for name in names:
+                self._subscribers[name][obj] = None
+                self._subscriber_lists.pop(name, None)
+
+    def _unsubscribe(self, root):
+        """
+        Take an object and everything below it out of the subscriber index.
+        """
+        for obj in walk(root):
+            children = getattr(obj, "children", None)
+            if isinstance(children, Children) and children._listener == self._tree_edited:
+                children._listener = None
+            for name in self._subscribed.pop(obj, ()):
+                del self._subscribers[name][obj]
+                self._subscriber_lists.pop(name, None)
+
+    def _tree_edited(self, child: GameObject, added: bool):
+        if added:
+            self._subscribe(child)
+        else:
+            self._unsubscribe(child)
+
     def signal(self, event, *, targets=None):
         """
         Add an event to the event queue.
@@ -443,6 +675,10 @@ class GameEngine(GameObject, LoggingMixin):
         else:
             event.__targets__ = None
         self.eventqueue.put(event)
+        if self.loop is not None and not self._dispatching:
+            # From another thread, a loop callback, or a signal handler; the
+            # loop may be asleep in select()
+            self.loop.call_soon_threadsafe(self._wakeup.set)
     
     def _signal_now(self, event, *, targets=None):
         """
@@ -463,7 +699,7 @@ class GameEngine(GameObject, LoggingMixin):
         Call before doing anything that will cause signals to be delivered to
         the wrong scene.
         """
-        self.eventqueue = queue.SimpleQueue()
+        self.eventqueue = PriorityEventQueue(self.event_priorities, self.eventqueue.max_delay)
 
     def on_start_scene(self, event: events.StartScene, signal: Callable[[Any], None]):
         """
@@ -512,7 +748,7 @@ class GameEngine(GameObject, LoggingMixin):
         # Empty the queue before changing scenes.
         self._flush_events()
         self._signal_now(events.ScenePaused())
-        self._publish_events()
+        self._publish_events(everything=True)
 
     def _stop_scene(self):
         """Stop the current scene."""
@@ -520,7 +756,7 @@ class GameEngine(GameObject, LoggingMixin):
         self._flush_events()
         # We need this to be distributed before the scene popping has happened
         self._signal_now(events.SceneStopped())
-        self._publish_events()
+        self._publish_events(everything=True)
         self.children.pop_scene()
 
     def _start_scene(self, scene, kwargs):
@@ -530,6 +766,24 @@ class GameEngine(GameObject, LoggingMixin):
         self.children.push_scene(scene)
         self.signal(events.SceneStarted())
 
+    def set_priority(self, event_type: Type, priority: Priority):
+        """
+        Set how urgently events of a type are delivered.
+
+        Primarily to be used by subsystems, for the events they signal.
+
+        More urgent events overtake less urgent ones in the queue, so only
+        give events the same priority if their order matters. Events that
+        haven't been given one are :attr:`~ppb.eventqueue.Priority.NORMAL`.
+
+        :param event_type: The class of an event. Applies to subclasses, too.
+        :param priority: A :class:`~ppb.eventqueue.Priority`.
+        :return: None
+        """
+        if not isinstance(event_type, type):
+            raise TypeError(f"{type(self)}.set_priority requires event_type to be a type.")
+        self.event_priorities[event_type] = Priority(priority)
+
     def register(self, event_type: Union[Type, _ellipsis], callback: Callable[[Any], None]):
         """
         Register a callback to be applied to an event at time of publishing.
@@ -0,0 +1,108 @@
+"""
+The engine's event queue, which lets urgent events overtake others.
+"""
+import enum
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any
+from typing import Dict
+from typing import Type
+from typing import Union
+
+
+class Priority(enum.IntEnum):
+    """
+    Classes of events, most urgent first.
+
+    Events within a class are delivered in the order they were signalled.
+    """
+    #: From the user, who is waiting to see what they did
+    INPUT = 0
+    #: Drawing a frame that has already started. Goes before scene changes,
+    #: which would otherwise flush the rest of the frame away.
+    RENDER = 1
+    #: Starting, stopping, and replacing scenes, and quitting
+    SCENE = 2
+    #: Anything not otherwise registered
+    NORMAL = 3
+    #: Housekeeping and outside notifications, which can wait. The engine
+    #: takes these one per loop, so an Idle can come between them.
+    BACKGROUND = 4
+
+
+class PriorityEventQueue:
+    """
+    A thread-safe event queue that delivers the most urgent event first.
+
+    To keep less urgent events moving, any event that has waited longer than
+    ``max_delay`` goes first, oldest first; except that nothing overtakes a
+    frame being drawn.
+
+    Has the parts of the :class:`queue.SimpleQueue` interface the engine uses.
+    """
+    def __init__(self, priorities: Dict[Type, Priority] = None, max_delay: float = 0.25):
+        """
+        :param priorities: Event class to priority. Subclasses share their
+           parent's priority unless they have their own. Kept by reference,
+           so later registrations take effect.
+        :param max_delay: Seconds an event may be held back for more urgent
+           ones.
+        """
+        self.priorities = {} if priorities is None else priorities
+        self.max_delay = max_delay
+        self._queues = [deque() for _ in Priority]
+        self._cond = threading.Condition()
+        self._size = 0
+        #: Seconds the event last taken had been queued
+        self.last_wait = 0.0
+        #: Events queued when the last one was taken, including it
+        self.last_depth = 0
+
+    def priority_of(self, event: Any) -> Priority:
+        for kind in type(event).__mro__:
+            if kind in self.priorities:
+                return self.priorities[kind]
+        return Priority.NORMAL
+
+    def put(self, event: Any):
+        entry = time.monotonic(), event
+        with self._cond:
+            self._queues[self.priority_of(event)].append(entry)
+            self._size += 1
+            self._cond.notify()
+
+    def get(self, block: bool = True, timeout: Union[float, None] = None) -> Any:
+        with self._cond:
+            if not self._size:
+                if not block or not self._cond.wait_for(lambda: self._size, timeout):
+                    raise queue.Empty
+            heads = [q for q in self._queues if q]
+            starving = ()
+            if not self._queues[Priority.RENDER]:
+                deadline = time.monotonic() - self.max_delay
+                starving = [q for q in heads if q[0][0] < deadline]
+            if starving:
+                q = min(starving, key=lambda q: q[0][0])
+            else:
+                q = heads[0]
+            queued, event = q.popleft()
+            self.last_wait = time.monotonic() - queued
+            self.last_depth = self._size
+            self._size -= 1
+            return event
+
+    def empty(self) -> bool:
+        return not self._size
+
+    def has_urgent(self) -> bool:
+        """
+        Whether anything more urgent than
+        :attr:`~Priority.BACKGROUND` is waiting.
+        """
+        with self._cond:
+            return any(self._queues[:Priority.BACKGROUND])
+
+    def qsize(self) -> int:
+        return self._size
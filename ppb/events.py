@@ -42,6 +42,7 @@ __all__ = (
     'SceneStarted',
     'SceneStopped',
     'StopScene',
+    'Timer',
     'Update',
     
 )
@@ -261,6 +262,19 @@ class Update:
     scene: Scene = None  #: The currently running scene.
 
 
+@dataclass
+class Timer:
+    """
+    A timer set with :class:`~ppb.systems.TimerService` has come due.
+
+    Delivered only to the timer's owner, if it has one; otherwise to
+    everything. Respond via ``on_timer``, and check :attr:`name`.
+    """
+    name: str  #: The name the timer was set with
+    time_delta: float  #: Seconds since the timer was set or last fired
+    scene: Scene = None  #: The currently running scene.
+
+
 @dataclass
 class AssetLoaded:
     """
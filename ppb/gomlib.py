@@ -11,6 +11,23 @@ from typing import Type
 from ppb.errors import BadChildException
 from ppb.errors import NotMyChildError
 
+_generation = 0
+
+
+def tree_generation() -> int:
+    """
+    A number that changes whenever any :class:`Children` is added to or
+    removed from.
+
+    Lets indexes of the object tree know when to rebuild.
+    """
+    return _generation
+
+
+def _tree_changed():
+    global _generation
+    _generation += 1
+
 
 class Children(Collection):
     """
@@ -23,12 +40,24 @@ class Children(Collection):
         self._all = set()
         self._kinds = defaultdict(set)
         self._tags = defaultdict(set)
+        # Child -> its tags, so removing a child doesn't search every tag
+        self._child_tags = defaultdict(set)
+        # The children as of the last change, to iterate over
+        self._order = None
+        # (tree generation, everything below in walk order)
+        self._walked = None
+        # Called with (child, added) after a child is added or removed, by
+        # whatever indexes the tree this belongs to
+        self._listener = None
 
     def __contains__(self, item: 'GameObject') -> bool:
         return item in self._all
 
     def __iter__(self) -> Iterator['GameObject']:
-        return (x for x in list(self._all))
+        # Iterating a snapshot lets the caller add and remove as it goes
+        if self._order is None:
+            self._order = tuple(self._all)
+        return iter(self._order)
 
     def __len__(self) -> int:
         return len(self._all)
@@ -55,11 +84,9 @@ class Children(Collection):
             raise TypeError("You passed a string instead of an iterable, this probably isn't what you intended.\n\nTry making it a tuple.")
 
         self._all.add(child)
-
-        for kind in type(child).mro():
-            self._kinds[kind].add(child)
-        for tag in tags:
-            self._tags[tag].add(child)
+        self._index(child, tags)
+        self._changed()
+        self._notify(child, True)
 
         return child
 
@@ -78,12 +105,35 @@ class Children(Collection):
             self._all.remove(child)
         except KeyError as exc:
             raise NotMyChildError() from exc
+        self._unindex(child)
+        self._changed()
+        self._notify(child, False)
+
+        return child
+
+    def _index(self, child: 'GameObject', tags: Iterable[Hashable]):
+        for kind in type(child).mro():
+            self._kinds[kind].add(child)
+        for tag in tags:
+            self._tags[tag].add(child)
+            self._child_tags[child].add(tag)
+
+    def _unindex(self, child: 'GameObject'):
         for kind in type(child).mro():
             self._kinds[kind].remove(child)
-        for s in self._tags.values():
-            s.discard(child)
+        for tag in self._child_tags.pop(child, ()):
+            tagged = self._tags[tag]
+            tagged.discard(child)
+            if not tagged:
+                del self._tags[tag]
 
-        return child
+    def _changed(self):
+        self._order = None
+        _tree_changed()
+
+    def _notify(self, child: 'GameObject', added: bool):
+        if self._listener is not None:
+            self._listener(child, added)
 
     def get(self, *, kind: Type = None, tag: 'GameObject' = None, **_) -> Iterator:
         """
@@ -115,14 +165,17 @@ class Children(Collection):
             tags = self._tags[tag]
         return (x for x in kinds.intersection(tags))
 
-    def walk(self):
+    def walk(self) -> Iterator['GameObject']:
         """
-        Iterate over the children and their children.
+        Iterate over the children and their children, breadth first.
+
+        The order is worked out again only after something in the tree is
+        added or removed.
         """
-        for child in self._all:
-            yield child
-            if hasattr(child, 'children') and hasattr(child.children.walk):
-                yield from child.children.walk()
+        generation = tree_generation()
+        if self._walked is None or self._walked[0] != generation:
+            self._walked = generation, tuple(_breadth_first(self))
+        return iter(self._walked[1])
 
     def tags(self):
         """
@@ -187,7 +240,16 @@ def walk(root) -> Iterable[GameObject]:
 
     Is non-recursive.
     """
-    q = deque([root])
+    yield root
+    children = getattr(root, 'children', None)
+    if isinstance(children, Children):
+        yield from children.walk()
+    elif children is not None:
+        yield from _breadth_first(children)
+
+
+def _breadth_first(children: Iterable) -> Iterator[GameObject]:
+    q = deque(children)
     while q:
         cur = q.popleft()
         yield cur
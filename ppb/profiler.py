@@ -0,0 +1,174 @@
+"""
+Measures where the engine's time goes: how long each event handler runs, and
+how long events wait in the queue.
+
+Opt in with ``GameEngine(..., profile=True)``, or by setting
+:attr:`GameEngine.profiler <ppb.engine.GameEngine.profiler>` to an
+:class:`EventProfiler` while it runs.
+"""
+import dataclasses
+import threading
+from time import perf_counter
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Type
+
+__all__ = 'EventProfiler', 'HandlerStats', 'QueueStats'
+
+
+@dataclasses.dataclass
+class HandlerStats:
+    """
+    Calls of one handler on one class of object, for one event type.
+    """
+    calls: int = 0
+    #: Seconds spent in the handler, in all
+    total: float = 0
+    #: Seconds spent in the longest call
+    max: float = 0
+    #: Calls that raised
+    exceptions: int = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0
+
+
+@dataclasses.dataclass
+class QueueStats:
+    """
+    Events of one type taken from the queue.
+    """
+    count: int = 0
+    #: Seconds the events spent queued, in all
+    total_wait: float = 0
+    max_wait: float = 0
+    #: Most events queued when one of these was taken, including itself
+    max_depth: int = 0
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.count if self.count else 0
+
+
+def _name(kind: Type) -> str:
+    return kind.__qualname__
+
+
+class EventProfiler:
+    """
+    Per-handler and per-event statistics, kept by the engine.
+
+    Handlers are keyed by (event type, object class, handler name). Safe to
+    read from other threads and from signal handlers while the engine runs.
+    """
+    def __init__(self):
+        # Reentrant, for signal handlers that interrupt the engine's thread
+        self._lock = threading.RLock()
+        self.handlers: Dict[Tuple[Type, Type, str], HandlerStats] = {}
+        self.queue: Dict[Type, QueueStats] = {}
+        self.started = perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self.handlers = {}
+            self.queue = {}
+            self.started = perf_counter()
+
+    def call(self, event: Any, obj: Any, name: str, method: Callable, *args) -> Any:
+        """
+        Call a handler, recording how long it takes and whether it raises.
+        """
+        failed = False
+        start = perf_counter()
+        try:
+            return method(*args)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            key = type(event), type(obj), name
+            with self._lock:
+                try:
+                    stats = self.handlers[key]
+                except KeyError:
+                    stats = self.handlers[key] = HandlerStats()
+                stats.calls += 1
+                stats.total += elapsed
+                if elapsed > stats.max:
+                    stats.max = elapsed
+                if failed:
+                    stats.exceptions += 1
+
+    def dequeued(self, event: Any, wait: float, depth: int):
+        """
+        Record an event taken from the queue.
+
+        :param wait: Seconds it was queued.
+        :param depth: Events queued at the time, including it.
+        """
+        with self._lock:
+            try:
+                stats = self.queue[type(event)]
+            except KeyError:
+                stats = self.queue[type(event)] = QueueStats()
+            stats.count += 1
+            stats.total_wait += wait
+            if wait > stats.max_wait:
+                stats.max_wait = wait
+            if depth > stats.max_depth:
+                stats.max_depth = depth
+
+    def slowest(self, count: int = 10, by: str = 'total') -> List[Tuple[Tuple[Type, Type, str], HandlerStats]]:
+        """
+        The handlers with the most time, by ``'total'``, ``'max'``, or
+        ``'mean'``.
+        """
+        with self._lock:
+            items = [(key, dataclasses.replace(stats)) for key, stats in self.handlers.items()]
+        items.sort(key=lambda item: getattr(item[1], by), reverse=True)
+        return items[:count]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Everything, as plain data.
+        """
+        with self._lock:
+            return {
+                'seconds': perf_counter() - self.started,
+                'handlers': [
+                    {
+                        'event': _name(event), 'object': _name(cls), 'handler': name,
+                        **dataclasses.asdict(stats),
+                    }
+                    for (event, cls, name), stats in self.handlers.items()
+                ],
+                'queue': {_name(event): dataclasses.asdict(stats) for event, stats in self.queue.items()},
+            }
+
+    def report(self, count: int = 15) -> str:
+        """
+        The slowest handlers and the longest-waiting events, as a table.
+        """
+        with self._lock:
+            seconds = perf_counter() - self.started
+            queue = sorted(self.queue.items(), key=lambda item: item[1].max_wait, reverse=True)
+            queue = [(event, dataclasses.replace(stats)) for event, stats in queue[:count]]
+        lines = [f"Engine profile over {seconds:.1f}s"]
+        lines.append(f"{'total ms':>10} {'calls':>7} {'mean ms':>8} {'max ms':>8} {'exc':>4}  handler")
+        for (event, cls, name), stats in self.slowest(count):
+            lines.append(
+                f"{stats.total * 1000:>10.1f} {stats.calls:>7} {stats.mean * 1000:>8.2f} "
+                f"{stats.max * 1000:>8.1f} {stats.exceptions:>4}  {_name(cls)}.{name} ({_name(event)})"
+            )
+        lines.append(f"{'events':>10} {'mean ms':>8} {'max ms':>8} {'depth':>6}  queued event")
+        for event, stats in queue:
+            lines.append(
+                f"{stats.count:>10} {stats.mean_wait * 1000:>8.2f} {stats.max_wait * 1000:>8.1f} "
+                f"{stats.max_depth:>6}  {_name(event)}"
+            )
+        return "\n".join(lines)
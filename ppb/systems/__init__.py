@@ -1,5 +1,7 @@
+from ppb.systems.clocks import TimerService
 from ppb.systems.clocks import Updater
 
 __all__ = (
+    'TimerService',
     'Updater',
 )
@@ -1,30 +1,218 @@
 """
-This module performs time keeping of subsystems 
+This module performs time keeping of subsystems
 """
-import signal
+import heapq
+import itertools
+import threading
+import weakref
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import Optional
 
 import ppb
 import ppb.events as events
 from ppb.systemslib import System
 
 
-class Updater(System):
-    time_step = 0.016
-    last_tick = None
+class _Entry:
+    __slots__ = 'key', 'deadline', 'interval', 'last', 'owner', 'make_event', 'cancelled'
+
+    def __init__(self, key, deadline, interval, last, owner, make_event):
+        self.key = key
+        self.deadline = deadline
+        self.interval = interval
+        self.last = last
+        self.owner = owner
+        self.make_event = make_event
+        self.cancelled = False
+
+
+class TimerService(System):
+    """
+    Signals events when timers come due, from a thread of its own.
+
+    Timers are named, and belong to an object (which alone gets the
+    :class:`~ppb.events.Timer` event) or to nobody (and everything gets it).
+    Setting a timer with the same owner and name as an existing one replaces
+    it. Timers belonging to an object are dropped once it's garbage.
+
+    When the engine runs on an asyncio loop, the loop serves the timers
+    instead of the thread.
+
+    Every event gets a ``timers`` attribute with this service, so handlers can
+    set timers: ::
+
+        def on_scene_started(self, event, signal):
+            event.timers.every(30, "refresh", owner=self)
+
+        def on_timer(self, event, signal):
+            if event.name == "refresh":
+                ...
+    """
+    _thread = None
+    _loop = None
+    _handle = None
+
+    def __init__(self, **props):
+        super().__init__(**props)
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self.engine.register(..., self._add_timers)
+
+    def _add_timers(self, event):
+        event.timers = self
 
     def __enter__(self):
-        self.last_tick = ppb.get_time()
-        signal.signal(signal.SIGALRM, self._on_sigalrm)
-        signal.setitimer(signal.ITIMER_REAL, self.time_step, self.time_step)
+        self._running = True
+        self._loop = getattr(self.engine, 'loop', None)
+        if self._loop is not None:
+            self._arm()
+        else:
+            self._thread = threading.Thread(None, self._timer_thread, name="ppb-timers", daemon=True)
+            self._thread.start()
 
     def __exit__(self, *exc):
-        signal.setitimer(signal.ITIMER_REAL, 0, 0)
-        signal.signal(signal.SIGALRM, signal.SIG_DFL)
-
-    def _on_sigalrm(self, signum, frame):
-        # Let's just assume that ITIMER is accurate
-        if self.last_tick is None:
-            self.last_tick = ppb.get_time()
-        this_tick = ppb.get_time()
-        self.engine.signal(events.Update(this_tick - self.last_tick))
-        self.last_tick = this_tick
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._handle is not None:
+            self._handle.cancel()
+        self._loop = self._handle = None
+
+    def _changed(self):
+        """
+        Wake whatever serves the timers. Call with the lock held.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._arm)
+        else:
+            self._cond.notify()
+
+    def _schedule(self, name: Hashable, delay: float, interval: Optional[float], owner: Any,
+                  make_event: Callable[[Hashable, float], Any]):
+        key = (weakref.ref(owner) if owner is not None else None, name)
+        now = ppb.get_time()
+        entry = _Entry(key, now + delay, interval, now, key[0], make_event)
+        with self._cond:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                old.cancelled = True
+            self._entries[key] = entry
+            heapq.heappush(self._heap, (entry.deadline, next(self._counter), entry))
+            self._changed()
+
+    def every(self, interval: float, name: Hashable, *, owner: Any = None, delay: Optional[float] = None):
+        """
+        Set a timer that fires every ``interval`` seconds.
+
+        :param interval: Seconds between firings.
+        :param name: Tells this timer apart from the owner's others.
+        :param owner: The object to deliver to, or None for everything.
+        :param delay: Seconds until the first firing; by default, ``interval``.
+        """
+        if interval <= 0:
+            raise ValueError("Timer interval must be positive")
+        self._schedule(name, interval if delay is None else delay, interval, owner, events.Timer)
+
+    def after(self, delay: float, name: Hashable, *, owner: Any = None):
+        """
+        Set a timer that fires once, ``delay`` seconds from now.
+
+        :param delay: Seconds until it fires.
+        :param name: Tells this timer apart from the owner's others.
+        :param owner: The object to deliver to, or None for everything.
+        """
+        self._schedule(name, delay, None, owner, events.Timer)
+
+    def cancel(self, name: Hashable, *, owner: Any = None):
+        """
+        Stop a timer, if it's set.
+        """
+        key = (weakref.ref(owner) if owner is not None else None, name)
+        with self._cond:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                entry.cancelled = True
+
+    def _due(self, now: float) -> list:
+        """
+        Take the timers that are due, and set the periodic ones again.
+
+        Call with the lock held.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry = heapq.heappop(self._heap)
+            if entry.cancelled:
+                continue
+            if entry.owner is not None and entry.owner() is None:
+                # The owner is gone
+                del self._entries[entry.key]
+                continue
+            due.append((entry, now - entry.last))
+            entry.last = now
+            if entry.interval is None:
+                del self._entries[entry.key]
+            else:
+                # Keep to the original schedule, unless we've fallen behind
+                entry.deadline += entry.interval
+                if entry.deadline <= now:
+                    entry.deadline = now + entry.interval
+                heapq.heappush(self._heap, (entry.deadline, next(self._counter), entry))
+        return due
+
+    def _fire(self, due: list):
+        for entry, delta in due:
+            owner = entry.owner() if entry.owner is not None else None
+            event = entry.make_event(entry.key[1], delta)
+            if owner is not None:
+                self.engine.signal(event, targets=[owner])
+            elif entry.owner is None:
+                self.engine.signal(event)
+
+    def _timer_thread(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = ppb.get_time()
+                due = self._due(now)
+                if not due:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            self._fire(due)
+
+    def _arm(self):
+        """
+        Fire what's due, and have the loop call back for the next deadline.
+        """
+        with self._cond:
+            if not self._running:
+                return
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+            now = ppb.get_time()
+            due = self._due(now)
+            if self._heap:
+                self._handle = self._loop.call_later(self._heap[0][0] - now, self._arm)
+        self._fire(due)
+
+
+class Updater(TimerService):
+    """
+    The timer service, also broadcasting :class:`~ppb.events.Update` every
+    ``time_step`` seconds.
+    """
+    time_step = 0.016
+
+    def __enter__(self):
+        super().__enter__()
+        self._schedule(Updater, self.time_step, self.time_step, None, lambda name, delta: events.Update(delta))